@@ -0,0 +1,318 @@
+"""Benchmarks of the URLs finder, the Latex merger and the publications finder.
+
+Run from the repository root:
+
+    python -m benchmarks.bench [--quick] [--output FILE] [--compare BASELINE]
+
+Corpora are synthetic and generated with a fixed seed, APIs are local stubs,
+so that results only depend on the code and the machine. Results are saved
+as JSON, and compared with a previous run to catch regressions.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from src.enums import Repos
+from src.latex.bibliography import BibliographyIndex
+from src.latex.latex_merger import LatexMerger
+from src.pub_finder import PubFinder
+from src.repos_finder import KEYWORDS, ReposFinder
+
+RESULTS_FOLDER = os.path.join("benchmarks", "results")
+
+
+class StubGitHub:
+    """GitHub API answering locally, after a simulated latency."""
+
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.calls = 0
+
+    def get_description_readme(self, org, repo, throttle=contextlib.nullcontext):
+        self.calls += 1
+        with throttle():
+            time.sleep(self.latency)
+        readme = f"see https://arxiv.org/abs/{repo}"
+        return "description", readme, f"https://github.com/{org}/{repo}"
+
+    def get_descriptions_readmes(self, repos, throttle=contextlib.nullcontext):
+        self.calls += 1
+        with throttle():
+            time.sleep(self.latency)
+        return {
+            (org, repo): ("description", f"see https://arxiv.org/abs/{repo}", "")
+            for org, repo in repos
+        }
+
+
+class StubZenodo:
+    """Zenodo API answering locally, after a simulated latency."""
+
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.calls = 0
+
+    def get_record(self, recid_or_doi, throttle=contextlib.nullcontext):
+        self.calls += 1
+        with throttle():
+            time.sleep(self.latency)
+        return '{"metadata": {"description": "record"}}', recid_or_doi
+
+
+class BenchPubFinder(PubFinder):
+    # same concurrency, without the requests per second limits of the real APIs
+    HOSTS_LIMITS = {
+        host: (concurrency, 10_000) for host, (concurrency, _) in PubFinder.HOSTS_LIMITS.items()
+    }
+
+
+def _words(rng, count):
+    vocabulary = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(500)
+    ]
+    vocabulary += KEYWORDS
+    return rng.choices(vocabulary, k=count)
+
+
+def _url(rng, i):
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"https://github.com/org{i % 50}/repo{i}"
+    if kind == 1:
+        return f"https://zenodo.org/records/{1000 + i}"
+    return f"https://doi.org/10.5281/zenodo.{1000 + i}"
+
+
+def _text(rng, words, urls):
+    """Text of `words` words with `urls` URLs spread in it, some in Latex commands."""
+    tokens = _words(rng, words)
+    for i in range(urls):
+        url = _url(rng, i)
+        if i % 3 == 0:
+            url = f"\\url{{{url}}}"
+        tokens.insert(rng.randrange(len(tokens) + 1), url)
+    return " ".join(tokens)
+
+
+def corpora(quick):
+    """Return the synthetic texts, by name."""
+    rng = random.Random(42)
+    scale = 10 if quick else 1
+    return {
+        "small": _text(rng, 5_000 // scale, 5),
+        "huge": _text(rng, 2_000_000 // scale, 50),
+        "many_urls": _text(rng, 200_000 // scale, 20_000 // scale),
+        # hosts without repos, and very long tokens, make regexes backtrack
+        "pathological": " ".join(
+            ["https://github.com/" + "a" * 200] * (5_000 // scale)
+            + ["github.com/" * 1000] * (50 // scale)
+            + ["x" * 100_000] * (10 // scale)
+        ),
+    }
+
+
+def _bbl(rng, entries):
+    lines = ["\\begin{thebibliography}{99}"]
+    for i in range(entries):
+        lines.append(f"\\bibitem[Author{i}]{{key{i}}} {' '.join(_words(rng, 20))}")
+        if i % 4 == 0:
+            lines.append(f"\\url{{{_url(rng, i)}}}")
+    lines.append("\\end{thebibliography}")
+    return "\n".join(lines)
+
+
+def _sources(folder, rng, papers, bbl_entries):
+    """Write the Latex sources of `papers` papers, with inputs and a bbl."""
+    for i in range(papers):
+        paper_folder = os.path.join(folder, f"2401.{i:05d}v1")
+        os.makedirs(os.path.join(paper_folder, "sections"))
+        sections = []
+        for j in range(5):
+            with open(os.path.join(paper_folder, "sections", f"s{j}.tex"), "w") as fp:
+                fp.write(_text(rng, 2_000, 2) + f" \\cite{{key{j}, key{j + 4}}}\n")
+            sections.append(f"\\input{{sections/s{j}}}")
+        with open(os.path.join(paper_folder, "main.tex"), "w") as fp:
+            fp.write("\\documentclass{article}\n\\begin{document}\n")
+            fp.write("\n".join(sections))
+            fp.write("\n\\end{document}\n")
+        with open(os.path.join(paper_folder, "main.bbl"), "w") as fp:
+            fp.write(_bbl(rng, bbl_entries))
+
+
+def _time(func, repeat):
+    """Run `func` `repeat` times, return the timings in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "repeat": repeat,
+    }
+
+
+def bench_repos_finder(texts, repeat):
+    finder = ReposFinder()
+    results = {}
+    for name, text in texts.items():
+        results[f"repos_finder.find_all.{name}"] = _time(
+            lambda: finder._find_all("2401.00001", text), repeat
+        )
+        results[f"repos_finder.find_contextualized.{name}"] = _time(
+            lambda: finder._find_contextualized("2401.00001", text), repeat
+        )
+        results[f"repos_finder.find_all.{name}"]["size"] = len(text)
+        results[f"repos_finder.find_contextualized.{name}"]["size"] = len(text)
+    return results
+
+
+def bench_bibliography(quick, repeat):
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, "main.bbl")
+        with open(filepath, "w") as fp:
+            fp.write(_bbl(rng, 500 if quick else 5_000))
+        # a new index each time, not to measure the cache
+        result = _time(lambda: BibliographyIndex().index_file(filepath), repeat)
+    return {"bibliography.index_file.bbl": result}
+
+
+def bench_latex_merger(quick, repeat):
+    results = {}
+    papers = 10 if quick else 100
+    for workers in (1, None):
+        name = f"latex_merger.run.workers_{workers or 'cpus'}"
+        timings = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as folder:
+                _sources(folder, random.Random(42), papers, 200)
+                start = time.perf_counter()
+                LatexMerger(folder, workers=workers).run()
+                timings.append(time.perf_counter() - start)
+        results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings),
+            "repeat": repeat,
+            "papers": papers,
+        }
+    return results
+
+
+def bench_pub_finder(quick, repeat):
+    rng = random.Random(42)
+    papers = 20 if quick else 200
+    publications = []
+    for i in range(papers):
+        # repos shared by many papers, as in real corpora
+        publications.append(
+            (
+                f"2401.{i:05d}",
+                {
+                    Repos.GITHUB.value: [
+                        (f"org{j}", f"repo{j}") for j in rng.sample(range(100), 3)
+                    ],
+                    Repos.ZENODO_RECORD.value: [str(j) for j in rng.sample(range(50), 1)],
+                    Repos.ZENODO_DOI.value: [],
+                },
+            )
+        )
+
+    calls = {}
+
+    def run():
+        github, zenodo = StubGitHub(), StubZenodo()
+        finder = BenchPubFinder(github, zenodo)
+        for _ in finder.find_many(publications):
+            pass
+        finder.close()
+        calls["api_calls"] = github.calls + zenodo.calls
+
+    result = _time(run, repeat)
+    result.update(calls, papers=papers)
+    return {"pub_finder.find_many": result}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_filepath, threshold):
+    """Return the benchmarks slower than the baseline by more than `threshold`."""
+    with open(baseline_filepath) as fp:
+        baseline = json.load(fp)["results"]
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["min"] > baseline[name]["min"] * threshold:
+            regressions.append((name, baseline[name]["min"], result["min"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="Run on smaller corpora.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark.")
+    parser.add_argument("--output", help="Results JSON file (default: in benchmarks/results).")
+    parser.add_argument("--compare", help="Previous results JSON file, to check regressions.")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression."
+    )
+    args = parser.parse_args()
+
+    results = {}
+    results.update(bench_repos_finder(corpora(args.quick), args.repeat))
+    results.update(bench_bibliography(args.quick, args.repeat))
+    results.update(bench_latex_merger(args.quick, args.repeat))
+    results.update(bench_pub_finder(args.quick, args.repeat))
+
+    for name, result in results.items():
+        print(f"{name:50} {result['min'] * 1000:10.1f} ms")
+
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output = args.output or os.path.join(RESULTS_FOLDER, f"bench_{timestamp}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as fp:
+        json.dump(
+            {
+                "timestamp": timestamp,
+                "commit": _git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "quick": args.quick,
+                "results": results,
+            },
+            fp,
+            indent=2,
+        )
+    print(f"Results saved in {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
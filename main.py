@@ -2,63 +2,280 @@ import argparse
 import os
 
 from src.arxiv import ArXiVDownloader
+from src.corpus import CorpusStore
+from src.evaluation import Evaluator
 from src.github import GitHubAPI
+from src.http_cache import HTTPCache
 from src.latex.latex_matcher import LatexMatcher
 from src.latex.latex_merger import LatexMerger
 from src.logger import setup_logger
+from src.metrics import metrics, profile
+from src.pdf.pdf_backends import BACKENDS
 from src.pdf.pdf_extractor import PDFExtractor
 from src.pdf.pdf_matcher import PDFMatcher
+from src.pipeline import PapersPipeline
 from src.zenodo import ZenodoAPI
 
 
-def download_sources(source_type, query, limit):
-    downloader = ArXiVDownloader()
+def download_sources(source_type, query, limit, workers, incremental, corpus):
+    downloader = ArXiVDownloader(workers, corpus=corpus)
     if source_type == "pdf":
-        downloader.download_pdfs(query, limit)
+        downloader.download_pdfs(query, limit, incremental)
     elif source_type == "latex":
-        downloader.download_sources(query, limit)
+        downloader.download_sources(query, limit, incremental)
     elif source_type == "both":
-        downloader.download(query, limit)
+        downloader.download(query, limit, incremental)
 
 
-def run_program(run_type):
-    access_token = os.environ.get("GITHUB_TOKEN")
-    if not access_token:
+def _access_tokens():
+    # multiple comma separated tokens are rotated when rate limited
+    access_tokens = os.environ.get("GITHUB_TOKENS") or os.environ.get("GITHUB_TOKEN") or ""
+    return [token.strip() for token in access_tokens.split(",") if token.strip()]
+
+
+def _apis(use_cache):
+    access_tokens = _access_tokens()
+    if not access_tokens:
         raise Exception(
             "GitHub token undefined in env var `GITHUB_TOKEN`. Get a new token at https://github.com/settings/tokens and set the env var `GITHUB_TOKEN`."
         )
-    github = GitHubAPI(access_token)
-    zenodo = ZenodoAPI()
+    cache = HTTPCache() if use_cache else None
+    return GitHubAPI(access_tokens, cache), ZenodoAPI(cache)
+
 
+def run_program(run_type, use_cache, workers, output, resume, corpus):
+    github, zenodo = _apis(use_cache)
     if run_type == "pdf":
-        matcher = PDFMatcher(github, zenodo)
+        matcher = PDFMatcher(
+            github, zenodo, workers, output or "results_pdfs.csv", resume, corpus
+        )
     elif run_type == "latex":
-        matcher = LatexMatcher(github, zenodo)
+        matcher = LatexMatcher(
+            github, zenodo, workers, output or "results_sources.csv", resume, corpus
+        )
     matcher.run()
 
 
-def extract_pdfs():
-    PDFExtractor().run()
+def _backend(backend_type, options):
+    """Create the PDF backend `backend_type`, with its options in `options`, by type."""
+    return BACKENDS[backend_type](**options.get(backend_type, {}))
+
+
+def extract_pdfs(
+    backend_type,
+    tika_servers,
+    concurrency,
+    timeout,
+    retries,
+    links_only,
+    targeted,
+    workers,
+    corpus,
+):
+    backend = _backend(
+        backend_type,
+        {
+            "tika": {
+                "server_urls": tika_servers.split(","),
+                "concurrency": concurrency,
+                "timeout": timeout,
+                "retries": retries,
+            },
+            "pypdf": {"links_only": links_only, "targeted": targeted, "workers": workers},
+        },
+    )
+    PDFExtractor(backend, corpus=corpus).run()
+
 
+def merge_latex(workers, corpus):
+    LatexMerger(workers=workers, corpus=corpus).run()
 
-def merge_latex():
-    LatexMerger().run()
+
+def run_pipeline(
+    source_type,
+    query,
+    limit,
+    download_workers,
+    extract_workers,
+    backend_type,
+    use_cache,
+    output,
+    resume,
+    corpus,
+):
+    github, zenodo = _apis(use_cache)
+    backend = _backend(backend_type, {"pypdf": {"workers": extract_workers}})
+    PapersPipeline(
+        ArXiVDownloader(download_workers, corpus=corpus),
+        github,
+        zenodo,
+        source_type,
+        backend=backend,
+        download_workers=download_workers,
+        extract_workers=extract_workers,
+        output=output,
+        resume=resume,
+    ).run(query, limit)
+
+
+def _rate_limits(rate_limits):
+    """Parse `host=requests/seconds,...`."""
+    limits = {}
+    for rate_limit in rate_limits.split(","):
+        host, limit = rate_limit.split("=")
+        requests, seconds = limit.split("/")
+        limits[host.strip()] = (int(requests), float(seconds))
+    return limits
+
+
+def evaluate(
+    eval_type,
+    fixtures,
+    gold,
+    reference,
+    record,
+    backend_type,
+    workers,
+    latency,
+    rate_limits,
+    output,
+):
+    access_tokens = _access_tokens()
+    if record and not access_tokens:
+        raise Exception(
+            "GitHub token undefined in env var `GITHUB_TOKEN`, required to record the responses."
+        )
+    backend = _backend(backend_type, {"pypdf": {"workers": workers}})
+    evaluator = Evaluator(
+        fixtures,
+        gold,
+        reference,
+        access_tokens or None,
+        record,
+        backend,
+        workers,
+        latency,
+        _rate_limits(rate_limits) if rate_limits else None,
+    )
+    kinds = ["latex", "pdf"] if eval_type == "both" else [eval_type]
+    evaluator.run(kinds, output)
 
 
-def clean_sources(clean_type):
+def clean_sources(clean_type, corpus):
     if clean_type == "pdf":
-        PDFExtractor().clean()
+        PDFExtractor(corpus=corpus).clean()
     elif clean_type == "latex":
-        LatexMerger().clean()
+        LatexMerger(corpus=corpus).clean()
 
 
-if __name__ == "__main__":
-    setup_logger()
+def run_command(args, corpus):
+    if args.command == "download":
+        download_sources(
+            args.type, args.query, args.limit, args.workers, args.incremental, corpus
+        )
+
+    if args.command == "run":
+        run_program(
+            args.type,
+            not args.no_cache,
+            args.workers,
+            args.output,
+            not args.restart,
+            corpus,
+        )
+
+    if args.command == "pipeline":
+        run_pipeline(
+            args.type,
+            args.query,
+            args.limit,
+            args.download_workers,
+            args.extract_workers,
+            args.backend,
+            not args.no_cache,
+            args.output,
+            not args.restart,
+            corpus,
+        )
+
+    if args.command == "extract-pdfs":
+        extract_pdfs(
+            args.backend,
+            args.tika_servers,
+            args.concurrency,
+            args.timeout,
+            args.retries,
+            args.links_only,
+            args.targeted,
+            args.workers,
+            corpus,
+        )
+
+    if args.command == "merge-latex":
+        merge_latex(args.workers, corpus)
+
+    if args.command == "evaluate":
+        evaluate(
+            args.type,
+            args.fixtures,
+            args.gold,
+            args.reference,
+            args.record,
+            args.backend,
+            args.workers,
+            args.latency,
+            args.rate_limits,
+            args.output,
+        )
+
+    if args.command == "clean":
+        clean_sources(args.type, corpus)
+
 
+if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Bidirectional Paper-Repository Traceability tool"
     )
 
+    parser.add_argument(
+        "--corpus",
+        required=False,
+        help="Track the papers stages in this SQLite file, instead of scanning the folders.",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Select the level of the logs, DEBUG logs each URL found and each repo checked.",
+    )
+    parser.add_argument(
+        "--metrics",
+        required=False,
+        help="Dump the metrics of the stages periodically to this file, "
+        "in the Prometheus text format for `.prom` files, JSON otherwise.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        required=False,
+        type=int,
+        default=30,
+        help="Specify the seconds between two dumps of the metrics.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the command, written in the `profiles` folder. Only the main thread "
+        "is profiled: for commands running the stages in pools (run, pipeline), the "
+        "profile shows the waits on their results, see the metrics for the stages.",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=["cprofile", "pyinstrument"],
+        default="cprofile",
+        help="Select whether to profile with cProfile or pyinstrument (optional dependency).",
+    )
+
     subparsers = parser.add_subparsers(help="subcommands", dest="command")
 
     # Download command
@@ -67,7 +284,7 @@ if __name__ == "__main__":
     )
     download_parser.add_argument(
         "--type",
-        choices=["pdf", "latex"],
+        choices=["pdf", "latex", "both"],
         required=True,
         help="Select whether to download PDFs or Latex files for ArXiV.",
     )
@@ -79,9 +296,22 @@ if __name__ == "__main__":
     download_parser.add_argument(
         "--limit",
         required=False,
+        type=int,
         default=1000,
         help="Specify how many PDF/Latex to download.",
     )
+    download_parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=1,
+        help="Specify how many papers to download concurrently.",
+    )
+    download_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Stop at the first already downloaded preprint, to fetch only new submissions.",
+    )
 
     # Run command
     run_parser = subparsers.add_parser("run", help="Check for bidirectional links.")
@@ -91,6 +321,155 @@ if __name__ == "__main__":
         required=True,
         help="Select whether to run using PDFs or Latex files.",
     )
+    run_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the cache of GitHub, Zenodo and DOI responses in `.cache/http`.",
+    )
+    run_parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Specify how many processes scan the files for URLs (default: number of CPUs).",
+    )
+    run_parser.add_argument(
+        "--output",
+        required=False,
+        help="Specify the results CSV file (default: `results_pdfs.csv` or `results_sources.csv`).",
+    )
+    run_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Overwrite the results file, instead of resuming from the publications already checked.",
+    )
+
+    # Pipeline command
+    pipeline_parser = subparsers.add_parser(
+        "pipeline",
+        help="Download, extract or merge, and check papers in a single streamed run.",
+    )
+    pipeline_parser.add_argument(
+        "--type",
+        choices=["pdf", "latex"],
+        required=True,
+        help="Select whether to run using PDFs or Latex files.",
+    )
+    pipeline_parser.add_argument(
+        "--query",
+        required=True,
+        help="Specify the query string when searching preprints to download on ArXiV.",
+    )
+    pipeline_parser.add_argument(
+        "--limit",
+        required=False,
+        type=int,
+        default=1000,
+        help="Specify how many PDF/Latex to download.",
+    )
+    pipeline_parser.add_argument(
+        "--download-workers",
+        required=False,
+        type=int,
+        default=1,
+        help="Specify how many papers to download concurrently.",
+    )
+    pipeline_parser.add_argument(
+        "--extract-workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Specify how many processes extract PDFs or merge Latex (default: number of CPUs).",
+    )
+    pipeline_parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="tika",
+        help="Select whether to extract PDFs with a Tika server or in-process with pypdf.",
+    )
+    pipeline_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the cache of GitHub, Zenodo and DOI responses in `.cache/http`.",
+    )
+    pipeline_parser.add_argument(
+        "--output",
+        required=False,
+        help="Specify the results CSV file (default: `results_pdfs.csv` or `results_sources.csv`).",
+    )
+    pipeline_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Overwrite the results file, instead of resuming from the publications already checked.",
+    )
+
+    # Evaluate command
+    evaluate_parser = subparsers.add_parser(
+        "evaluate",
+        help="Score the matchers against the reference results, with recorded API responses.",
+    )
+    evaluate_parser.add_argument(
+        "--type",
+        choices=["pdf", "latex", "both"],
+        default="both",
+        help="Select whether to evaluate using PDFs, Latex files or both.",
+    )
+    evaluate_parser.add_argument(
+        "--fixtures",
+        required=False,
+        default="data/evaluation",
+        help="Specify the folder with the `pdfs` and `sources` of the papers, "
+        "and the recorded responses in `responses.jsonl.gz`.",
+    )
+    evaluate_parser.add_argument(
+        "--gold",
+        required=False,
+        default="gold.csv",
+        help="Specify the CSV file of the repos of each paper, checked manually.",
+    )
+    evaluate_parser.add_argument(
+        "--reference",
+        required=False,
+        default="data/LaTeX-PreliminaryResults.csv",
+        help="Specify the CSV file of previous results, to compare with.",
+    )
+    evaluate_parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Fetch and record the GitHub, Zenodo and DOI responses, instead of replaying them.",
+    )
+    evaluate_parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="pypdf",
+        help="Select whether to extract PDFs with a Tika server or in-process with pypdf.",
+    )
+    evaluate_parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Specify how many processes extract, merge and scan the papers (default: number of CPUs).",
+    )
+    evaluate_parser.add_argument(
+        "--latency",
+        required=False,
+        type=float,
+        default=0,
+        help="Specify the simulated latency in seconds of each replayed response.",
+    )
+    evaluate_parser.add_argument(
+        "--rate-limits",
+        required=False,
+        help="Specify the simulated rate limits of the replayed APIs, "
+        "e.g. `api.github.com=5000/3600,zenodo.org=100/60`.",
+    )
+    evaluate_parser.add_argument(
+        "--output",
+        required=False,
+        default="evaluation.json",
+        help="Specify the JSON file of the evaluation report.",
+    )
 
     # Clean command
     clean_parser = subparsers.add_parser(
@@ -104,25 +483,83 @@ if __name__ == "__main__":
     )
 
     extract_parser = subparsers.add_parser(
-        "extract-pdfs", help="Extract all PDFs content using Tika."
+        "extract-pdfs", help="Extract all PDFs content using Tika or pypdf."
+    )
+    extract_parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="tika",
+        help="Select whether to extract with Tika servers or in-process with pypdf.",
+    )
+    extract_parser.add_argument(
+        "--tika-servers",
+        required=False,
+        default="http://127.0.0.1:9998",
+        help="With Tika, specify comma separated URLs of the servers to use.",
+    )
+    extract_parser.add_argument(
+        "--concurrency",
+        required=False,
+        type=int,
+        default=2,
+        help="With Tika, specify how many PDFs each server extracts concurrently.",
+    )
+    extract_parser.add_argument(
+        "--timeout",
+        required=False,
+        type=int,
+        default=300,
+        help="Specify the timeout in seconds of each PDF extraction.",
+    )
+    extract_parser.add_argument(
+        "--retries",
+        required=False,
+        type=int,
+        default=2,
+        help="Specify how many times a failed PDF extraction is retried.",
+    )
+    extract_parser.add_argument(
+        "--links-only",
+        action="store_true",
+        help="With pypdf, only extract the URLs of the PDF links, much faster than the text.",
+    )
+    extract_parser.add_argument(
+        "--targeted",
+        action="store_true",
+        help="With pypdf, extract the pages most likely to contain repos URLs first, "
+        "and all the pages only when none is found.",
+    )
+    extract_parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=None,
+        help="With pypdf, specify how many processes extract PDFs (default: number of CPUs).",
     )
     merge_parser = subparsers.add_parser(
         "merge-latex", help="Merge all Latex files embedding citations."
     )
+    merge_parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Specify how many processes merge Latex files (default: number of CPUs).",
+    )
 
     args = parser.parse_args()
+    setup_logger(args.log_level)
+    corpus = CorpusStore(args.corpus) if args.corpus else None
 
-    if args.command == "download":
-        download_sources(args.type, args.query)
-
-    if args.command == "run":
-        run_program(args.type)
-
-    if args.command == "extract-pdfs":
-        extract_pdfs()
-
-    if args.command == "merge-latex":
-        merge_latex()
-
-    if args.command == "clean":
-        clean_sources(args.type)
+    if args.metrics:
+        metrics.start_dumping(args.metrics, args.metrics_interval)
+    try:
+        if args.profile:
+            with profile(args.command, args.profiler):
+                run_command(args, corpus)
+        else:
+            run_command(args, corpus)
+    finally:
+        metrics.log_summary()
+        if args.metrics:
+            metrics.stop_dumping(args.metrics)
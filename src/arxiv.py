@@ -1,29 +1,157 @@
+import gzip
+import hashlib
+import io
 import logging
 import os
+import shutil
 import tarfile
+import threading
 import time
-
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import arxiv
 
+from .manifest import DownloadManifest
+from .metrics import metrics
+from .rate_limiter import RateLimiter
+from .utils import new_session
+
 logger = logging.getLogger("ArXiV")
 
+CHUNK_SIZE = 8192
+GZIP_MAGIC = b"\x1f\x8b"
+TAR_BLOCK_SIZE = 512
+SOURCE_EXTENSIONS = (".tex", ".bbl")
+
+
+class _HashingReader(io.RawIOBase):
+    """Readable stream computing the size and checksum of all data read."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.size = 0
+        self.checksum = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._fileobj.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.size += n
+        self.checksum.update(data)
+        return n
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Readable stream returning `prefix` first, then the rest of `fileobj`."""
+
+    def __init__(self, prefix, fileobj):
+        self._prefix = prefix
+        self._fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            data, self._prefix = self._prefix[: len(buffer)], self._prefix[len(buffer) :]
+        else:
+            data = self._fileobj.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        return n
+
 
 class ArXiVDownloader:
     PDFS_FOLDER = "pdfs"
     SOURCES_FOLDER = "sources"
+    MANIFEST_FILE = "manifest.jsonl"
     SLEEP_TIME = 0.5
 
-    def __init__(self):
+    def __init__(self, workers=1, stream_sources=True, corpus=None):
         self._url_pdf = "https://arxiv.org/pdf/{arxiv_id}.pdf"
         self._url_latex = "https://arxiv.org/e-print/{arxiv_id}"
+        self._workers = workers
+        self._stream_sources = stream_sources
+        # one limiter shared by all workers, to respect ArXiV request budget
+        self._rate_limiter = RateLimiter("arxiv", rate=1 / self.SLEEP_TIME)
+        self._local = threading.local()
+        self._manifest = DownloadManifest(self.MANIFEST_FILE)
+        self._corpus = corpus
+        if corpus:
+            corpus.import_manifest(self._manifest)
 
         if not os.path.exists(self.PDFS_FOLDER):
             os.makedirs(self.PDFS_FOLDER)
         if not os.path.exists(self.SOURCES_FOLDER):
             os.makedirs(self.SOURCES_FOLDER)
 
+    @property
+    def _session(self):
+        """Pooled HTTP session, one per worker thread."""
+        if not hasattr(self._local, "session"):
+            self._local.session = new_session(pool_size=self._workers)
+        return self._local.session
+
+    def _get(self, url, headers=None):
+        self._rate_limiter.acquire()
+        response = self._session.get(url, headers=headers, stream=True)
+        # 416: the requested range starts at the end of the file, handled by the caller
+        if response.status_code != 416:
+            response.raise_for_status()  # Raise an error for failed requests
+        return response
+
+    def _checksum(self, filepath):
+        checksum = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                checksum.update(chunk)
+        return checksum
+
+    def _fetch(self, url, filepath, arxiv_id, kind):
+        """Download `url` to `filepath`, resuming any previous partial download.
+
+        Data is written to a `.part` file first, renamed when complete.
+        """
+        part_filepath = f"{filepath}.part"
+        start = time.perf_counter()
+        headers = {}
+        if os.path.exists(part_filepath):
+            size = os.path.getsize(part_filepath)
+            headers["Range"] = f"bytes={size}-"
+            logger.debug(f"Resuming {part_filepath} from byte {size}")
+
+        response = self._get(url, headers)
+        if response.status_code == 206:
+            checksum = self._checksum(part_filepath)
+            mode = "ab"
+        elif response.status_code == 416:
+            checksum = self._checksum(part_filepath)
+            mode = None
+        else:
+            # no partial file, or the server ignored the range: start over
+            checksum = hashlib.sha256()
+            mode = "wb"
+
+        downloaded = 0
+        if mode:
+            with open(part_filepath, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    checksum.update(chunk)
+                    downloaded += len(chunk)
+        metrics.inc("download_bytes_total", downloaded, kind=kind)
+        metrics.observe("download_seconds", time.perf_counter() - start, kind=kind)
+
+        os.replace(part_filepath, filepath)
+        size = os.path.getsize(filepath)
+        self._manifest.update(
+            arxiv_id, kind, DownloadManifest.DONE, size, checksum.hexdigest()
+        )
+        return filepath
+
     def _search(self, query="cat:cs.SE", limit=1000):
         """Search in ArXiV."""
         search = arxiv.Search(
@@ -43,71 +171,214 @@ class ArXiVDownloader:
 
     def _download_pdf(self, arxiv_id):
         """Download a single PDF by ArXiV id."""
-        logger.info(f"Downloading {arxiv_id} PDF.")
-        download_url = self._url_pdf.format(arxiv_id)
-        filename = f"{arxiv_id}.pdf"
+        download_url = self._url_pdf.format(arxiv_id=arxiv_id)
+        folder_path = os.path.join(self.PDFS_FOLDER, arxiv_id)
+        filepath = os.path.join(folder_path, f"{arxiv_id}.pdf")
 
-        try:
-            response = requests.get(download_url, stream=True)
-            response.raise_for_status()  # Raise an error for failed requests
+        if self._manifest.is_done(arxiv_id, "pdf") and os.path.exists(filepath):
+            logger.debug(f"{arxiv_id} PDF already downloaded, skipping...")
+            return True
+        if os.path.exists(filepath):
+            # downloaded before the manifest existed
+            checksum = self._checksum(filepath).hexdigest()
+            size = os.path.getsize(filepath)
+            self._manifest.update(arxiv_id, "pdf", DownloadManifest.DONE, size, checksum)
+            return True
 
-            with open(os.path.join(self.PDFS_FOLDER, filename), "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        logger.info(f"Downloading {arxiv_id} PDF.")
+        try:
+            os.makedirs(folder_path, exist_ok=True)
+            self._fetch(download_url, filepath, arxiv_id, "pdf")
         except Exception:
             logger.error(f"Failed to download {arxiv_id} PDF.")
+            self._failed(arxiv_id, "pdf", f"{filepath}.part")
+            return False
+        return True
 
-    def download_pdfs(self, query, limit=1000):
-        """Download all PDFs found by search query."""
-        for arxiv_id in self._search(query, limit):
-            self._download_pdf(arxiv_id)
-            time.sleep(self.SLEEP_TIME)
+    def _write_member(self, fileobj, folder_path, name):
+        """Write an extracted file, refusing paths outside of `folder_path`."""
+        filepath = os.path.normpath(os.path.join(folder_path, name))
+        if not filepath.startswith(os.path.abspath(folder_path) + os.sep):
+            logger.warning(f"Skipping unsafe path `{name}` in {folder_path}")
+            return
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as output:
+            shutil.copyfileobj(fileobj, output, CHUNK_SIZE)
 
-    def _extract_tar(self, filepath, arxiv_id):
-        """Extract tex/bbl from tar."""
+    def _extract_members(self, fileobj, arxiv_id, folder_path):
+        """Write the tex/bbl files of an e-print stream to `folder_path`."""
+        stream = io.BufferedReader(fileobj, CHUNK_SIZE)
+        if stream.peek(len(GZIP_MAGIC)).startswith(GZIP_MAGIC):
+            stream = gzip.GzipFile(fileobj=stream)
+        head = stream.read(TAR_BLOCK_SIZE)
+        stream = _PrefixedReader(head, stream)
+
+        if head[257:262] == b"ustar":
+            with tarfile.open(fileobj=stream, mode="r|") as archive:
+                for member in archive:
+                    if member.isfile() and member.name.endswith(SOURCE_EXTENSIONS):
+                        self._write_member(
+                            archive.extractfile(member), folder_path, member.name
+                        )
+        elif head.startswith(b"%PDF"):
+            logger.warning(f"{arxiv_id} has no Latex sources, only PDF. Skipping...")
+        else:
+            logger.debug(f"{arxiv_id} e-print is a single tex file.")
+            self._write_member(stream, folder_path, f"{arxiv_id}.tex")
+
+    def _extract_stream(self, fileobj, arxiv_id):
+        """Extract tex/bbl from an e-print stream, in a single pass.
+
+        An e-print is either a gzipped tar, a single gzipped tex file or a PDF
+        (no sources available). Only the kept files are written to disk.
+        """
         folder_path = os.path.join(self.SOURCES_FOLDER, arxiv_id)
-        os.makedirs(folder_path, exist_ok=True)
+        tmp_folder_path = os.path.abspath(f"{folder_path}.part")
+        shutil.rmtree(tmp_folder_path, ignore_errors=True)
+        os.makedirs(tmp_folder_path)
 
-        logger.debug(f"Extracting {filepath} to {folder_path}...")
         try:
-            with tarfile.open(filepath, "r:gz") as archive:
-                for member in archive.getmembers():
-                    if member.name.endswith((".tex", ".bbl")):
-                        archive.extract(member, path=folder_path)
-        except (tarfile.ReadError, EOFError) as e:
+            self._extract_members(fileobj, arxiv_id, tmp_folder_path)
+        except Exception:
+            shutil.rmtree(tmp_folder_path, ignore_errors=True)
+            raise
+
+        shutil.rmtree(folder_path, ignore_errors=True)
+        os.replace(tmp_folder_path, folder_path)
+        return folder_path
+
+    def _extract_tar(self, filepath, arxiv_id):
+        """Extract tex/bbl from a downloaded e-print."""
+        logger.debug(f"Extracting {filepath}...")
+        try:
+            with open(filepath, "rb") as f:
+                folder_path = self._extract_stream(f, arxiv_id)
+        except (tarfile.ReadError, EOFError, OSError) as e:
             logger.error(f"Error extracting {filepath}. Reason: {e}. Skipping...")
+            folder_path = None
 
         os.remove(filepath)
         return folder_path
 
+    def _stream_source(self, download_url, arxiv_id):
+        """Download and extract an e-print on the fly, without writing the archive."""
+        start = time.perf_counter()
+        response = self._get(download_url)
+        response.raw.decode_content = True
+        reader = _HashingReader(response.raw)
+        self._extract_stream(reader, arxiv_id)
+        metrics.inc("download_bytes_total", reader.size, kind="latex")
+        metrics.observe("download_seconds", time.perf_counter() - start, kind="latex")
+        self._manifest.update(
+            arxiv_id,
+            "latex",
+            DownloadManifest.DONE,
+            reader.size,
+            reader.checksum.hexdigest(),
+        )
+
     def _download_source(self, arxiv_id):
         """Download a single Latex by ArXiV id."""
-        logger.info(f"Downloading {arxiv_id} Latex.")
-        download_url = self._url_latex.format(arxiv_id)
-        filename = f"{arxiv_id}.tar.gz"
-
-        try:
-            response = requests.get(download_url, stream=True)
-            response.raise_for_status()
+        download_url = self._url_latex.format(arxiv_id=arxiv_id)
+        filepath = os.path.join(self.SOURCES_FOLDER, f"{arxiv_id}.tar.gz")
 
-            filepath = os.path.join(self.SOURCES_FOLDER, filename)
-            with open(filepath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        folder_path = os.path.join(self.SOURCES_FOLDER, arxiv_id)
+        if self._manifest.is_done(arxiv_id, "latex") and os.path.isdir(folder_path):
+            logger.debug(f"{arxiv_id} Latex already downloaded, skipping...")
+            return True
+        if os.path.isdir(folder_path) and os.listdir(folder_path):
+            # downloaded before the manifest existed
+            self._manifest.update(arxiv_id, "latex", DownloadManifest.DONE)
+            return True
 
-            self._extract_tar(filepath)
+        logger.info(f"Downloading {arxiv_id} Latex.")
+        try:
+            # a partial archive from a previous run is resumed instead
+            if self._stream_sources and not os.path.exists(f"{filepath}.part"):
+                self._stream_source(download_url, arxiv_id)
+            else:
+                self._fetch(download_url, filepath, arxiv_id, "latex")
+                self._extract_tar(filepath, arxiv_id)
         except Exception:
             logger.error(f"Failed to download {arxiv_id} Latex.")
+            self._failed(arxiv_id, "latex", f"{filepath}.part")
+            return False
+        return True
 
-    def download_sources(self, query, limit=1000):
-        """Download all Latex found by search query."""
+    def _failed(self, arxiv_id, kind, part_filepath):
+        """Record a failed download, as partial if it can be resumed."""
+        if os.path.exists(part_filepath):
+            size = os.path.getsize(part_filepath)
+            self._manifest.update(arxiv_id, kind, DownloadManifest.PARTIAL, size)
+        else:
+            self._manifest.update(arxiv_id, kind, DownloadManifest.FAILED)
+
+    def _download_one(self, arxiv_id, kinds):
+        """Download all the requested kinds of files of one paper."""
+        return all([self.download_paper(arxiv_id, kind) for kind in kinds])
+
+    def _pending(self, query, limit, kinds, incremental):
+        """Yield the search results that still need to be downloaded.
+
+        Search results are sorted by most recent first: when `incremental`,
+        stop at the first paper already downloaded to only fetch new submissions.
+        """
         for arxiv_id in self._search(query, limit):
-            self._download_source(arxiv_id)
-            time.sleep(self.SLEEP_TIME)
+            if all(self._manifest.is_done(arxiv_id, kind) for kind in kinds):
+                if incremental:
+                    logger.info(f"Reached already downloaded {arxiv_id}, stopping.")
+                    return
+                logger.debug(f"{arxiv_id} already downloaded, skipping...")
+                continue
+            yield arxiv_id
+
+    def _download_all(self, query, limit, kinds, incremental=False):
+        """Download the `kinds` of files of each search result, concurrently.
+
+        Return a map of `arxiv_id` -> `True` if all downloads succeeded.
+        """
+        results = {}
+        pending = self._pending(query, limit, kinds, incremental)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                executor.submit(self._download_one, arxiv_id, kinds): arxiv_id
+                for arxiv_id in pending
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        self.compact_manifest()
+
+        failed = [arxiv_id for arxiv_id, ok in results.items() if not ok]
+        logger.info(f"Downloaded {len(results) - len(failed)}/{len(results)} papers.")
+        if failed:
+            logger.error(f"Failed downloads: {', '.join(failed)}")
+        return results
 
-    def download(self, query, limit=1000):
+    def compact_manifest(self):
+        """Drop the outdated entries of the manifest, appended to during the downloads."""
+        self._manifest.compact()
+
+    def search(self, query, limit=1000):
+        """Yield the ids of the papers found by search query, most recent first."""
+        return self._search(query, limit)
+
+    def download_paper(self, arxiv_id, kind):
+        """Download the PDF or the Latex of one paper, return True on success."""
+        download_funcs = {"pdf": self._download_pdf, "latex": self._download_source}
+        if not download_funcs[kind](arxiv_id):
+            return False
+        if self._corpus:
+            self._corpus.add(arxiv_id, kind)
+        return True
+
+    def download_pdfs(self, query, limit=1000, incremental=False):
+        """Download all PDFs found by search query."""
+        return self._download_all(query, limit, ["pdf"], incremental)
+
+    def download_sources(self, query, limit=1000, incremental=False):
+        """Download all Latex found by search query."""
+        return self._download_all(query, limit, ["latex"], incremental)
+
+    def download(self, query, limit=1000, incremental=False):
         """Download all PDFs and Latex found by search query."""
-        for arxiv_id in self._search(query, limit):
-            self._download_pdf(arxiv_id)
-            self._download_source(arxiv_id)
-            time.sleep(self.SLEEP_TIME)
+        return self._download_all(query, limit, ["pdf", "latex"], incremental)
@@ -0,0 +1,175 @@
+"""Indexed store of the papers of the corpus and of their processing state."""
+
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger("Corpus")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    arxiv_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    stage INTEGER NOT NULL,
+    text BLOB,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (arxiv_id, kind)
+);
+CREATE INDEX IF NOT EXISTS papers_stage ON papers (kind, stage);
+CREATE TABLE IF NOT EXISTS repos (
+    arxiv_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    repo_id TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (arxiv_id, kind, repo, repo_id)
+);
+"""
+
+
+class CorpusStore:
+    """SQLite store of the stage of each paper, with its text, repos and results.
+
+    Each paper, per kind (`pdf` or `latex`), goes through the stages
+    DOWNLOADED, EXTRACTED (PDF extracted or Latex merged) and CHECKED.
+    Stages query the papers pending in the previous stage, instead of
+    walking the `pdfs` or `sources` folders. Texts are stored compressed.
+    """
+
+    DOWNLOADED = 1
+    EXTRACTED = 2
+    CHECKED = 3
+
+    def __init__(self, filepath="corpus.sqlite"):
+        self._filepath = filepath
+        self._lock = threading.Lock()
+        # shared by the threads, serialized by the lock
+        self._db = sqlite3.connect(filepath, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _now(self):
+        return datetime.now().isoformat(timespec="seconds")
+
+    def add(self, arxiv_id, kind):
+        """Record a downloaded paper, unless already known at a later stage."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO papers (arxiv_id, kind, stage, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (arxiv_id, kind, self.DOWNLOADED, self._now()),
+            )
+
+    def get_stage(self, arxiv_id, kind):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT stage FROM papers WHERE arxiv_id = ? AND kind = ?", (arxiv_id, kind)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_text(self, arxiv_id, kind, text):
+        """Store the extracted or merged text of a paper, now EXTRACTED."""
+        compressed = zlib.compress(text.encode("utf-8"))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO papers (arxiv_id, kind, stage, text, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (arxiv_id, kind) DO UPDATE SET stage = ?, text = ?, updated_at = ?",
+                (
+                    arxiv_id,
+                    kind,
+                    self.EXTRACTED,
+                    compressed,
+                    self._now(),
+                    self.EXTRACTED,
+                    compressed,
+                    self._now(),
+                ),
+            )
+
+    def get_text(self, arxiv_id, kind):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text FROM papers WHERE arxiv_id = ? AND kind = ?", (arxiv_id, kind)
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def set_results(self, arxiv_id, kind, results):
+        """Store the repos found in a paper and their results, now CHECKED."""
+        rows = [
+            (arxiv_id, kind, repo, json.dumps(_id), result)
+            for repo, ids in results.items()
+            for _id, result in ids.items()
+        ]
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM repos WHERE arxiv_id = ? AND kind = ?", (arxiv_id, kind)
+            )
+            self._db.executemany("INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.execute(
+                "UPDATE papers SET stage = ?, updated_at = ? WHERE arxiv_id = ? AND kind = ?",
+                (self.CHECKED, self._now(), arxiv_id, kind),
+            )
+
+    def get_results(self, arxiv_id, kind):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT repo, repo_id, result FROM repos WHERE arxiv_id = ? AND kind = ?",
+                (arxiv_id, kind),
+            ).fetchall()
+        results = {}
+        for repo, repo_id, result in rows:
+            _id = json.loads(repo_id)
+            # JSON has no tuples, GitHub ids are `(org, repo)`
+            results.setdefault(repo, {})[tuple(_id) if isinstance(_id, list) else _id] = result
+        return results
+
+    def pending(self, kind, stage):
+        """Return the ids of the papers at the given stage, waiting for the next one."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT arxiv_id FROM papers WHERE kind = ? AND stage = ? ORDER BY arxiv_id",
+                (kind, stage),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def reset(self, kind, stage):
+        """Move back to `stage` the papers beyond it, forgetting their texts or results.
+
+        Return the ids of the papers reset.
+        """
+        arxiv_ids = [
+            arxiv_id
+            for later_stage in range(stage + 1, self.CHECKED + 1)
+            for arxiv_id in self.pending(kind, later_stage)
+        ]
+        with self._lock, self._db:
+            if stage < self.CHECKED:
+                self._db.execute("DELETE FROM repos WHERE kind = ?", (kind,))
+            if stage < self.EXTRACTED:
+                self._db.execute("UPDATE papers SET text = NULL WHERE kind = ?", (kind,))
+            self._db.execute(
+                "UPDATE papers SET stage = ?, updated_at = ? WHERE kind = ? AND stage > ?",
+                (stage, self._now(), kind, stage),
+            )
+        return arxiv_ids
+
+    def import_manifest(self, manifest):
+        """Record the downloads of a `DownloadManifest` not in the corpus yet."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO papers (arxiv_id, kind, stage, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (arxiv_id, kind, self.DOWNLOADED, self._now())
+                    for arxiv_id, kind in manifest.done()
+                ],
+            )
+
+    def close(self):
+        self._db.close()
@@ -3,12 +3,14 @@ import re
 
 import requests
 
+from .metrics import metrics
 from .utils import is_valid_url
 
 logger = logging.getLogger("DOI")
 
 DOI_REGEX = r"^10\.\d{4,9}/[-._;()/:A-Z0-9]+$"
 DOI_URL_REGEX = r"https?:\/\/doi\.org\/10.5281/zenodo.[0-9]+"
+DOI_CACHE_TTL = 30 * 24 * 60 * 60  # 30 days
 
 
 def is_valid_doi(doi):
@@ -25,8 +27,11 @@ def get_valid_url(doi_url):
     return match.group(0)
 
 
-def get_redirect_url(doi):
-    """Given a DOI or a URL of a DOI, returns the redirect URL."""
+def get_redirect_url(doi, cache=None):
+    """Given a DOI or a URL of a DOI, returns the redirect URL.
+
+    When an `HTTPCache` is given, the DOI resolution is cached.
+    """
     if is_valid_doi(doi):
         doi_url = f"https://doi.org/{doi}"
     elif is_valid_url(doi):
@@ -37,17 +42,24 @@ def get_redirect_url(doi):
         raise ValueError(error_msg)
 
     try:
-        logger.debug(f"Resolving DOI for `{doi_url}`")
-        response = requests.get(doi_url, allow_redirects=False)
+        logger.debug("Resolving DOI for `%s`", doi_url)
+        if cache:
+            # DOIs are persistent, their redirects rarely change
+            response = cache.get(doi_url, allow_redirects=False, ttl=DOI_CACHE_TTL, api="doi")
+        else:
+            metrics.inc("api_calls_total", api="doi")
+            response = requests.get(doi_url, allow_redirects=False)
 
-        logger.debug(f"DOI response: `{response.text}`")
+        # for each DOI: the body is decoded only when logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("DOI response: `%s`", response.text)
 
         # Check if the response has a 'Location' header
         if "Location" in response.headers or "location" in response.headers:
             location = response.headers.get("Location") or response.headers.get(
                 "location"
             )
-            logger.debug(f"Response: {location}")
+            logger.debug("Response: %s", location)
             return location
         else:
             error_msg = f"No 'Location' header found in the response for DOI {doi}."
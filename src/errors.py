@@ -10,3 +10,12 @@ class PDFsExtractedNotFound(Exception):
             "Cannot find any `extracted.txt` file. Did you run the extraction first?"
         )
         super().__init__(message)
+
+
+class EvaluationFixturesNotFound(Exception):
+    def __init__(self, fixtures, missing):
+        message = (
+            f"Cannot find {missing} in `{fixtures}`. Did you set `--fixtures`, "
+            "and record the responses with `--record`?"
+        )
+        super().__init__(message)
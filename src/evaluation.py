@@ -0,0 +1,297 @@
+"""Score the matchers against reference results, with replayed API responses."""
+
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from .corpus import CorpusStore
+from .enums import Repos
+from .errors import EvaluationFixturesNotFound
+from .github import GitHubAPI
+from .latex.latex_matcher import LatexMatcher
+from .latex.latex_merger import LatexMerger
+from .manifest import split_version
+from .pdf.pdf_extractor import PDFExtractor
+from .pdf.pdf_matcher import PDFMatcher
+from .replay import ReplayArchive
+from .zenodo import ZenodoAPI
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("Evaluation")
+
+GITHUB_URL_REGEX = r"github\.com/([a-zA-Z0-9_.-]+)/([a-zA-Z0-9_.-]+)"
+# records, API records and DOIs of the same Zenodo deposit share their number
+ZENODO_URL_REGEX = r"zenodo\.org/(?:api/)?records?/(\d+)|10\.5281/zenodo\.(\d+)"
+REPO_TYPES = ["github", "zenodo", "other"]
+
+
+def url_key(url):
+    """Return the `(type, id)` of a repo URL, comparable with `result_key`."""
+    if match := re.search(GITHUB_URL_REGEX, url, re.I):
+        org, repo = match.groups()
+        repo = repo.rstrip(".")
+        repo = repo[:-4] if repo.endswith(".git") else repo
+        return "github", f"{org}/{repo}".lower()
+    if match := re.search(ZENODO_URL_REGEX, url, re.I):
+        return "zenodo", match[1] or match[2]
+    return "other", url.strip().rstrip("/").lower()
+
+
+def result_key(repo, _id):
+    """Return the `(type, id)` of a repo id, as found by the matchers."""
+    if repo == Repos.GITHUB.value:
+        return url_key("https://github.com/{}/{}".format(*_id))
+    if repo == Repos.ZENODO_RECORD.value:
+        return url_key(f"https://zenodo.org/records/{_id}")
+    return url_key(_id)
+
+
+def load_gold(filepath):
+    """Load the repos of the papers, one `<arxiv_id>.pdf,<url or none>` per line."""
+    links = {}
+    with open(filepath, newline="") as fp:
+        for row in csv.reader(fp):
+            if not row:
+                continue
+            arxiv_id, _ = split_version(row[0].removesuffix(".pdf"))
+            keys = links.setdefault(arxiv_id, set())
+            for url in row[1:]:
+                if url.strip() and url.strip().lower() != "none":
+                    keys.add(url_key(url))
+    return links
+
+
+def load_reference(filepath):
+    """Load the repos of the papers and the repos linking back, from previous results."""
+    links = {}
+    bidirectional = {}
+    with open(filepath, newline="") as fp:
+        for row in csv.DictReader(fp):
+            if not row["ArXiV id"]:
+                continue
+            arxiv_id, _ = split_version(row["ArXiV id"])
+            keys = links.setdefault(arxiv_id, set())
+            found = bidirectional.setdefault(arxiv_id, set())
+            for name, contains in (
+                ("GitHub", "GitHub repo contains ArXiV URL"),
+                ("Zenodo", "Zenodo record contains ArXiV URL"),
+            ):
+                if row[f"Contains {name} URL"] == "Found" and row[f"{name} URL"]:
+                    keys.add(url_key(row[f"{name} URL"]))
+                    if row[contains] == "Found":
+                        found.add(url_key(row[f"{name} URL"]))
+    return links, bidirectional
+
+
+def score(expected, found):
+    """Precision and recall per repo type, over the papers of `expected` evaluated."""
+    counts = {repo_type: {"tp": 0, "fp": 0, "fn": 0} for repo_type in REPO_TYPES}
+    for arxiv_id, found_keys in found.items():
+        if arxiv_id not in expected:
+            continue
+        expected_keys = expected[arxiv_id]
+        for repo_type, _ in found_keys & expected_keys:
+            counts[repo_type]["tp"] += 1
+        for repo_type, _ in found_keys - expected_keys:
+            counts[repo_type]["fp"] += 1
+        for repo_type, _ in expected_keys - found_keys:
+            counts[repo_type]["fn"] += 1
+
+    for count in counts.values():
+        found_count = count["tp"] + count["fp"]
+        expected_count = count["tp"] + count["fn"]
+        count["precision"] = count["tp"] / found_count if found_count else None
+        count["recall"] = count["tp"] / expected_count if expected_count else None
+    return counts
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process and of its pools, if known."""
+    if not resource:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak / unit
+
+
+class Evaluator:
+    """Run the Latex and PDF matchers on a fixed corpus and score their results.
+
+    The papers are read from `fixtures/pdfs` and `fixtures/sources`, and the
+    GitHub, Zenodo and DOI responses replayed from `fixtures/responses.jsonl.gz`,
+    with the given `latency` and `rate_limits`: a run makes no network call,
+    so that results and timings only depend on the code. With `record`, the
+    responses are fetched and recorded instead. Without any paper, or without
+    recorded responses, the evaluation fails instead of reporting nothing.
+
+    Each run works on a copy of the papers, extracted or merged again, in a
+    temporary corpus store where the matchers keep all the repos found.
+    """
+
+    def __init__(
+        self,
+        fixtures="data/evaluation",
+        gold="gold.csv",
+        reference="data/LaTeX-PreliminaryResults.csv",
+        access_tokens=None,
+        record=False,
+        backend=None,
+        workers=None,
+        latency=0,
+        rate_limits=None,
+    ):
+        self._fixtures = fixtures
+        self._gold = load_gold(gold)
+        self._links, self._bidirectional = load_reference(reference)
+        self._access_tokens = access_tokens or ["replay"]
+        self._record = record
+        self._backend = backend
+        self._workers = workers
+        self._latency = latency
+        self._rate_limits = rate_limits
+
+    def _copy(self, kind, folder):
+        """Copy the papers of the references to `folder`, without extracted files."""
+        input_folder = os.path.join(self._fixtures, "pdfs" if kind == "pdf" else "sources")
+        if not os.path.isdir(input_folder):
+            return []
+        references = self._gold.keys() | self._links.keys()
+        dirs = [
+            dir for dir in sorted(os.listdir(input_folder)) if split_version(dir)[0] in references
+        ]
+        for dir in dirs:
+            shutil.copytree(
+                os.path.join(input_folder, dir),
+                os.path.join(folder, dir),
+                ignore=shutil.ignore_patterns("extracted.txt", "merged.tex"),
+            )
+        return dirs
+
+    def _run(self, kind, workspace):
+        """Extract or merge, then check the papers, return the repos found and checked."""
+        folder = os.path.join(workspace, "pdfs" if kind == "pdf" else "sources")
+        os.makedirs(folder)
+        dirs = self._copy(kind, folder)
+        if not dirs:
+            logger.warning(f"No {kind} papers of the references in {self._fixtures}")
+            return None
+
+        responses = os.path.join(self._fixtures, "responses.jsonl.gz")
+        if not self._record and not os.path.exists(responses):
+            raise EvaluationFixturesNotFound(self._fixtures, "the recorded responses")
+
+        corpus = CorpusStore(os.path.join(workspace, "corpus.sqlite"))
+        for dir in dirs:
+            corpus.add(dir, kind)
+        # no cache, all the requests go through the archive
+        github, zenodo = GitHubAPI(self._access_tokens), ZenodoAPI()
+        archive = ReplayArchive(
+            responses,
+            self._record,
+            0 if self._record else self._latency,
+            None if self._record else self._rate_limits,
+        )
+        output = os.path.join(workspace, f"results_{kind}.csv")
+
+        start = time.monotonic()
+        with archive:
+            if kind == "pdf":
+                failures = os.path.join(workspace, "extract_failures.jsonl")
+                PDFExtractor(self._backend, folder, failures, corpus).run()
+                matcher = PDFMatcher(github, zenodo, self._workers, output, False, corpus)
+                matcher.PDFS_FOLDER = folder
+            else:
+                LatexMerger(folder, self._workers, corpus).run()
+                matcher = LatexMatcher(github, zenodo, self._workers, output, False, corpus)
+                matcher.SOURCES_FOLDER = folder
+            matcher.run()
+        elapsed = time.monotonic() - start
+
+        found = {}
+        checked = {}
+        for dir in dirs:
+            arxiv_id, _ = split_version(dir)
+            results = corpus.get_results(dir, kind)
+            found[arxiv_id] = {
+                result_key(repo, _id) for repo, ids in results.items() for _id in ids
+            }
+            checked[arxiv_id] = {
+                result_key(repo, _id)
+                for repo, ids in results.items()
+                for _id, result in ids.items()
+                if result == "Found"
+            }
+        corpus.close()
+
+        calls = archive.requests
+        if not self._record and archive.missed:
+            logger.warning(f"{archive.missed} responses not recorded, run with `--record`")
+        return {
+            "papers": len(dirs),
+            "elapsed": elapsed,
+            "papers_per_sec": len(dirs) / elapsed if elapsed else None,
+            "api_calls": calls,
+            "api_calls_per_paper": calls / len(dirs),
+            "rate_limited": archive.limited,
+            "found": found,
+            "checked": checked,
+        }
+
+    def _report(self, kind, run):
+        report = {
+            key: value for key, value in run.items() if key not in ("found", "checked")
+        }
+        report["links_gold"] = score(self._gold, run["found"])
+        report["links_reference"] = score(self._links, run["found"])
+        report["bidirectional_reference"] = score(self._bidirectional, run["checked"])
+
+        logger.info(
+            f"{kind}: {run['papers']} papers in {run['elapsed']:.1f}s, "
+            f"{run['papers_per_sec']:.2f} papers/s, "
+            f"{run['api_calls_per_paper']:.1f} API calls/paper"
+        )
+        for name in ("links_gold", "links_reference", "bidirectional_reference"):
+            for repo_type, count in report[name].items():
+                if count["tp"] + count["fp"] + count["fn"] == 0:
+                    continue
+                precision = "-" if count["precision"] is None else f"{count['precision']:.2f}"
+                recall = "-" if count["recall"] is None else f"{count['recall']:.2f}"
+                logger.info(
+                    f"{kind} | {name} | {repo_type}: precision {precision}, recall {recall} "
+                    f"(tp {count['tp']}, fp {count['fp']}, fn {count['fn']})"
+                )
+        return report
+
+    def run(self, kinds=("latex", "pdf"), output=None):
+        """Evaluate each kind of papers, return the report, also written to `output`."""
+        report = {}
+        with tempfile.TemporaryDirectory() as workspace:
+            for kind in kinds:
+                run = self._run(kind, os.path.join(workspace, kind))
+                if run:
+                    report[kind] = self._report(kind, run)
+        if not report:
+            raise EvaluationFixturesNotFound(self._fixtures, "any paper of the references")
+        report["peak_rss_mb"] = _peak_rss_mb()
+        if report["peak_rss_mb"] is not None:
+            logger.info(f"Peak memory: {report['peak_rss_mb']:.0f} MB")
+
+        if output:
+            with open(output, "w") as fp:
+                json.dump(report, fp, indent=2)
+            logger.info(f"Evaluation report written to {output}")
+        return report
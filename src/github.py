@@ -1,11 +1,46 @@
+import contextlib
 import logging
 import re
+import threading
+import time
 
 from github import Auth, Github
-from github.GithubException import GithubException
+from github.GithubException import (
+    GithubException,
+    RateLimitExceededException,
+    UnknownObjectException,
+)
+from urllib3.util.retry import Retry
+
+from .metrics import metrics
+from .utils import new_session
 
 logger = logging.getLogger("GitHubAPI")
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+GRAPHQL_BATCH_SIZE = 50
+GRAPHQL_REPO_QUERY = """
+r{i}: repository(owner: $o{i}, name: $n{i}) {{
+  description
+  object(expression: "HEAD:") {{ ... on Tree {{ entries {{ name type }} }} }}
+}}"""
+GRAPHQL_README_QUERY = """
+r{i}: repository(owner: $o{i}, name: $n{i}) {{
+  {files}
+}}"""
+GRAPHQL_FILE_QUERY = "f{j}: object(expression: $e{i}_{j}) {{ ... on Blob {{ text }} }}"
+
+# retry the server errors only: PyGithub's default retry sleeps in the client
+# until the rate limit reset, the token pool would never switch tokens
+GITHUB_RETRY = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=(500, 502, 503, 504),
+    respect_retry_after_header=False,
+)
+# wait advised by GitHub on secondary rate limits, without `Retry-After`
+SECONDARY_RATE_LIMIT_WAIT = 60
+
 GITHUB_RESERVED_ORG_NAMES = ["features", "orgs"]
 GITHUB_RESERVED_REPO_NAMES = [
     "settings",
@@ -18,45 +53,303 @@ GITHUB_RESERVED_REPO_NAMES = [
 ]
 
 
-class GitHubAPI:
+class RateLimitError(Exception):
+    def __init__(self, reset):
+        self.reset = reset
+        super().__init__(f"GitHub rate limit exceeded, reset at {reset}")
+
+
+class GitHubClient:
+    """PyGithub client and session of one token, with its remaining quotas."""
+
     def __init__(self, access_token):
-        auth = Auth.Token(access_token)
-        self.github = Github(auth=auth)
-
-    def get_description_readme(self, org_name, repo_name):
-        logger.info(f"url parsing: org `{org_name}`, repo `{repo_name}`")
-        try:
-            repo = self.github.get_repo(f"{org_name}/{repo_name}")
-            description = repo.description or ""
-
-            filenames = [file.name for file in repo.get_contents("")]
-            readme_files = [
-                filename
-                for filename in filenames
-                if filename.lower().startswith("readme")
-            ]
-            logger.info(f"all readme files: {', '.join(readme_files)}")
-
-            concatenated_readme_contents = ""
-            for readme_file in readme_files:
-                try:
-                    file_content = repo.get_contents(readme_file).decoded_content.decode(
-                        "utf-8"
-                    )
-                    concatenated_readme_contents += file_content
-                except Exception:
-                    # weird errors with some readme files
-                    continue
-        except GithubException:
-            logger.info(f"GitHub repo deleted, skipping...")
-            description = ""
-            concatenated_readme_contents = ""
+        self.github = Github(auth=Auth.Token(access_token), retry=GITHUB_RETRY)
+        self.session = new_session()
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+        # REST and GraphQL APIs have separate quotas, unknown until the first call
+        self.remaining = {"rest": None, "graphql": None}
+        self.reset = {"rest": 0, "graphql": 0}
+
+    def update(self, api, remaining, reset):
+        self.remaining[api] = int(remaining)
+        self.reset[api] = int(reset)
 
-        return (
-            description,
-            concatenated_readme_contents,
-            f"https://github.com/{org_name}/{repo_name}",
-        )
+    def update_rest(self):
+        """Read the REST quota of the last PyGithub response.
+
+        Only after a successful response: without quota headers, PyGithub
+        requests it from the API.
+        """
+        remaining, _ = self.github.rate_limiting
+        self.update("rest", remaining, self.github.rate_limiting_resettime)
 
     def close(self):
         self.github.close()
+        self.session.close()
+
+
+class GitHubTokenPool:
+    """Pool of GitHub clients, one per token.
+
+    Requests use the client with the most remaining quota. When the quota
+    of all tokens is exhausted, wait until the first reset instead of failing.
+    """
+
+    MIN_REMAINING = 10
+
+    def __init__(self, access_tokens):
+        self.clients = [GitHubClient(access_token) for access_token in access_tokens]
+        self._lock = threading.Lock()
+
+    def _remaining(self, client, api):
+        remaining = client.remaining[api]
+        if remaining is None or client.reset[api] < time.time():
+            # unknown, or the quota has been reset since
+            return float("inf")
+        return remaining
+
+    def acquire(self, api="rest"):
+        """Return the client with the most remaining quota, waiting if needed."""
+        while True:
+            with self._lock:
+                client = max(self.clients, key=lambda c: self._remaining(c, api))
+                if self._remaining(client, api) > self.MIN_REMAINING:
+                    return client
+                wait = min(c.reset[api] for c in self.clients) - time.time() + 1
+
+            logger.warning(f"GitHub {api} rate limit reached, pausing for {wait:.0f}s")
+            time.sleep(max(wait, 1))
+            metrics.observe("rate_limit_sleep_seconds", max(wait, 1), limiter=f"github-{api}")
+
+    def exhausted(self, client, api, reset):
+        """Mark the quota of the client as exhausted until `reset`."""
+        with self._lock:
+            client.update(api, 0, reset or time.time() + 60)
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+
+class GitHubAPI:
+    def __init__(self, access_tokens, cache=None):
+        """Use one or many tokens, rotated when the rate limit is reached."""
+        if isinstance(access_tokens, str):
+            access_tokens = [access_tokens]
+        self._tokens = GitHubTokenPool(access_tokens)
+        self.github = self._tokens.clients[0].github
+        self._cache = cache
+
+    def _cache_key(self, org_name, repo_name):
+        return f"github:{org_name}/{repo_name}".lower()
+
+    def get_description_readme(self, org_name, repo_name, throttle=contextlib.nullcontext):
+        """Return the description and concatenated README files of a repo.
+
+        When an `HTTPCache` is given, results are cached: PyGithub performs
+        the requests, so the cache stores the final result per repo. The
+        fetches of uncached repos run within the context `throttle()`.
+        """
+        cache_key = self._cache_key(org_name, repo_name)
+        if self._cache and (cached := self._cache.get_value(cache_key)):
+            logger.debug("cache hit: org `%s`, repo `%s`", org_name, repo_name)
+            return tuple(cached)
+
+        with throttle():
+            result, cacheable = self._get_description_readme(org_name, repo_name)
+        if self._cache and cacheable:
+            self._cache.set_value(cache_key, result)
+        return result
+
+    def _get_description_readme(self, org_name, repo_name):
+        """Fetch from the REST API, waiting or switching token if rate limited.
+
+        Return the result and if it can be cached.
+        """
+        url = f"https://github.com/{org_name}/{repo_name}"
+        while True:
+            client = self._tokens.acquire("rest")
+            metrics.inc("api_calls_total", api="github-rest")
+            try:
+                description, readme = self._fetch_description_readme(
+                    client.github, org_name, repo_name
+                )
+                client.update_rest()
+                return (description, readme, url), True
+            except RateLimitExceededException as e:
+                self._rate_limited(client, e.headers)
+            except UnknownObjectException:
+                logger.info(f"GitHub repo deleted, skipping...")
+                return ("", "", url), True
+            except GithubException as e:
+                if e.status == 429:
+                    self._rate_limited(client, e.headers)
+                    continue
+                logger.error(f"GitHub error {e.status} for {org_name}/{repo_name}, skipping...")
+                return ("", "", url), False
+
+    def _rate_limited(self, client, headers):
+        """Pause the REST quota of the client until the reset, or the advised wait."""
+        headers = headers or {}
+        if headers.get("x-ratelimit-remaining") == "0":
+            reset = headers.get("x-ratelimit-reset")
+            self._tokens.exhausted(client, "rest", reset and int(reset))
+            return
+        # secondary rate limit, with quota left: back off instead of retrying at once
+        wait = int(headers.get("retry-after") or SECONDARY_RATE_LIMIT_WAIT)
+        logger.warning(f"GitHub secondary rate limit, pausing the token for {wait}s")
+        self._tokens.exhausted(client, "rest", int(time.time()) + wait)
+
+    def _fetch_description_readme(self, github, org_name, repo_name):
+        logger.info("url parsing: org `%s`, repo `%s`", org_name, repo_name)
+        repo = github.get_repo(f"{org_name}/{repo_name}")
+        description = repo.description or ""
+
+        filenames = [file.name for file in repo.get_contents("")]
+        readme_files = [
+            filename
+            for filename in filenames
+            if filename.lower().startswith("readme")
+        ]
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("all readme files: %s", ", ".join(readme_files))
+
+        concatenated_readme_contents = ""
+        for readme_file in readme_files:
+            try:
+                file_content = repo.get_contents(readme_file).decoded_content.decode(
+                    "utf-8"
+                )
+                concatenated_readme_contents += file_content
+            except RateLimitExceededException:
+                raise
+            except Exception:
+                # weird errors with some readme files
+                continue
+
+        return description, concatenated_readme_contents
+
+    def _graphql(self, queries, variables):
+        """Run a GraphQL query made of the given `repository` queries.
+
+        Wait or switch token when the GraphQL rate limit is reached.
+        """
+        declarations = ", ".join(f"${name}: String!" for name in variables)
+        query = f"query({declarations}) {{{''.join(queries)}\n}}"
+        while True:
+            client = self._tokens.acquire("graphql")
+            metrics.inc("api_calls_total", api="github-graphql")
+            response = client.session.post(
+                GRAPHQL_URL, json={"query": query, "variables": variables}
+            )
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            reset = response.headers.get("X-RateLimit-Reset")
+            if remaining is not None and reset is not None:
+                client.update("graphql", remaining, reset)
+
+            if response.status_code in (403, 429) and remaining == "0":
+                self._tokens.exhausted(client, "graphql", reset and int(reset))
+                continue
+            response.raise_for_status()
+            content = response.json()
+            errors = content.get("errors") or []
+            if any(error.get("type") == "RATE_LIMITED" for error in errors):
+                self._tokens.exhausted(client, "graphql", reset and int(reset))
+                continue
+            return content.get("data") or {}
+
+    def _readme_filenames(self, repository):
+        tree = repository.get("object") or {}
+        return [
+            entry["name"]
+            for entry in tree.get("entries", [])
+            if entry["type"] == "blob" and entry["name"].lower().startswith("readme")
+        ]
+
+    def _batch_description_readme(self, repos):
+        """Fetch description and README files of many repos, with 2 GraphQL queries.
+
+        Return a map of `(org, repo)` -> result, only for the resolved repos.
+        """
+        queries = []
+        variables = {}
+        for i, (org_name, repo_name) in enumerate(repos):
+            queries.append(GRAPHQL_REPO_QUERY.format(i=i))
+            variables[f"o{i}"] = org_name
+            variables[f"n{i}"] = repo_name
+        data = self._graphql(queries, variables)
+
+        resolved = {}
+        for i, _id in enumerate(repos):
+            if repository := data.get(f"r{i}"):
+                resolved[_id] = (repository["description"] or "", self._readme_filenames(repository))
+
+        queries = []
+        variables = {}
+        with_readme = [(_id, filenames) for _id, (_, filenames) in resolved.items() if filenames]
+        for i, ((org_name, repo_name), filenames) in enumerate(with_readme):
+            files = []
+            for j, filename in enumerate(filenames):
+                files.append(GRAPHQL_FILE_QUERY.format(i=i, j=j))
+                variables[f"e{i}_{j}"] = f"HEAD:{filename}"
+            queries.append(GRAPHQL_README_QUERY.format(i=i, files=" ".join(files)))
+            variables[f"o{i}"] = org_name
+            variables[f"n{i}"] = repo_name
+        data = self._graphql(queries, variables) if queries else {}
+
+        readmes = {}
+        for i, (_id, filenames) in enumerate(with_readme):
+            repository = data.get(f"r{i}") or {}
+            blobs = [repository.get(f"f{j}") or {} for j in range(len(filenames))]
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("all readme files: %s", ", ".join(filenames))
+            readmes[_id] = "".join(blob.get("text") or "" for blob in blobs)
+
+        return {
+            (org_name, repo_name): (
+                description,
+                readmes.get((org_name, repo_name), ""),
+                f"https://github.com/{org_name}/{repo_name}",
+            )
+            for (org_name, repo_name), (description, _) in resolved.items()
+        }
+
+    def get_descriptions_readmes(self, repos, throttle=contextlib.nullcontext):
+        """Batch version of `get_description_readme`, for many `(org, repo)`.
+
+        Repos are fetched in batches with the GraphQL API, falling back to the
+        REST API for the repos that the batch could not resolve.
+        Return a map of `(org, repo)` -> `(description, readme, url)`.
+        """
+        results = {}
+        missing = []
+        for org_name, repo_name in dict.fromkeys(repos):
+            cache_key = self._cache_key(org_name, repo_name)
+            if self._cache and (cached := self._cache.get_value(cache_key)):
+                results[(org_name, repo_name)] = tuple(cached)
+            else:
+                missing.append((org_name, repo_name))
+
+        for start in range(0, len(missing), GRAPHQL_BATCH_SIZE):
+            batch = missing[start : start + GRAPHQL_BATCH_SIZE]
+            logger.info(f"Fetching {len(batch)} GitHub repos in batch")
+            try:
+                with throttle():
+                    fetched = self._batch_description_readme(batch)
+            except Exception as e:
+                logger.warning(f"GitHub batch query failed: {e}. Falling back to REST...")
+                fetched = {}
+
+            for org_name, repo_name in batch:
+                if (org_name, repo_name) in fetched:
+                    result = fetched[(org_name, repo_name)]
+                    if self._cache:
+                        self._cache.set_value(self._cache_key(org_name, repo_name), result)
+                else:
+                    result = self.get_description_readme(org_name, repo_name, throttle)
+                results[(org_name, repo_name)] = result
+
+        return results
+
+    def close(self):
+        self._tokens.close()
@@ -0,0 +1,196 @@
+"""Persistent cache of HTTP responses, shared by the API clients."""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .metrics import metrics
+
+logger = logging.getLogger("HTTP cache")
+
+ONE_DAY = 24 * 60 * 60
+ONE_GB = 1024 * 1024 * 1024
+
+
+class CachedResponse:
+    """Minimal response, as returned by the cache."""
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    """On-disk HTTP cache, with TTLs, ETag revalidation and LRU eviction.
+
+    Each entry is stored in a file named by the hash of the request, with
+    a first JSON line of metadata followed by the raw body. When an entry
+    is expired, it is revalidated with `If-None-Match`/`If-Modified-Since`
+    and only downloaded again if changed. When the cache grows above
+    `max_size` bytes, the least recently used entries are deleted.
+    """
+
+    def __init__(self, folder=".cache/http", ttl=ONE_DAY, max_size=ONE_GB):
+        self._folder = folder
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        os.makedirs(self._folder, exist_ok=True)
+        self._sizes = {
+            entry.name: entry.stat().st_size
+            for entry in os.scandir(self._folder)
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        }
+        self._size = sum(self._sizes.values())
+
+    def _key(self, *parts):
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def _read(self, key):
+        filepath = os.path.join(self._folder, key)
+        try:
+            with open(filepath, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+        except (OSError, ValueError):
+            return None, None
+        os.utime(filepath)  # mark as recently used
+        return meta, content
+
+    def _write(self, key, meta, content):
+        filepath = os.path.join(self._folder, key)
+        tmp_filepath = f"{filepath}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, "wb") as f:
+            f.write(json.dumps(meta).encode("utf-8") + b"\n")
+            f.write(content)
+        os.replace(tmp_filepath, filepath)
+
+        with self._lock:
+            self._size += os.path.getsize(filepath) - self._sizes.get(key, 0)
+            self._sizes[key] = os.path.getsize(filepath)
+            if self._size > self._max_size:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries, down to 90% of the max size."""
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((os.path.getmtime(os.path.join(self._folder, key)), key))
+            except OSError:
+                entries.append((0, key))
+        entries.sort()
+
+        evicted = 0
+        for _, key in entries:
+            if self._size <= self._max_size * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self._folder, key))
+            except OSError:
+                pass
+            self._size -= self._sizes.pop(key)
+            evicted += 1
+        logger.debug(f"Evicted {evicted} entries from the cache")
+
+    def _is_fresh(self, meta, ttl):
+        return time.time() - meta["stored_at"] < ttl
+
+    def get(
+        self,
+        url,
+        session=None,
+        headers=None,
+        ttl=None,
+        allow_redirects=True,
+        api=None,
+        throttle=contextlib.nullcontext,
+    ):
+        """GET `url`, from the cache when fresh, from the network otherwise.
+
+        The requests sent are counted in `api_calls_total`, labelled `api`,
+        and sent within the context `throttle()`, e.g. to rate limit them.
+        """
+        ttl = self._ttl if ttl is None else ttl
+        key = self._key("GET", url, str(allow_redirects))
+        meta, content = self._read(key)
+
+        source = urlparse(url).hostname
+        if meta and self._is_fresh(meta, ttl):
+            self.hits += 1
+            metrics.inc("cache_hits_total", source=source)
+            return CachedResponse(meta["status_code"], meta["headers"], content, url)
+
+        request_headers = dict(headers or {})
+        if meta:
+            cached_headers = CaseInsensitiveDict(meta["headers"])
+            if etag := cached_headers.get("ETag"):
+                request_headers["If-None-Match"] = etag
+            if last_modified := cached_headers.get("Last-Modified"):
+                request_headers["If-Modified-Since"] = last_modified
+
+        session = session or requests
+        if api:
+            metrics.inc("api_calls_total", api=api)
+        with throttle():
+            response = session.get(url, headers=request_headers, allow_redirects=allow_redirects)
+
+        if meta and response.status_code == 304:
+            self.revalidated += 1
+            metrics.inc("cache_revalidated_total", source=source)
+            meta["stored_at"] = time.time()
+            self._write(key, meta, content)
+            return CachedResponse(meta["status_code"], meta["headers"], content, url)
+
+        self.misses += 1
+        metrics.inc("cache_misses_total", source=source)
+        # do not cache server errors or rate limits, they are transient
+        if response.status_code < 500 and response.status_code not in (403, 429):
+            meta = {
+                "url": url,
+                "status_code": response.status_code,
+                "headers": dict(response.headers),
+                "stored_at": time.time(),
+            }
+            self._write(key, meta, response.content)
+        return response
+
+    def get_value(self, name, ttl=None):
+        """Return a value stored with `set_value`, if any and still fresh."""
+        ttl = self._ttl if ttl is None else ttl
+        meta, content = self._read(self._key("VALUE", name))
+        # e.g. `github` for `github:org/repo`
+        source = name.split(":")[0]
+        if meta and self._is_fresh(meta, ttl):
+            self.hits += 1
+            metrics.inc("cache_hits_total", source=source)
+            return json.loads(content)
+        self.misses += 1
+        metrics.inc("cache_misses_total", source=source)
+        return None
+
+    def set_value(self, name, value):
+        """Store a JSON serializable value, for responses not fetched by the cache."""
+        meta = {"name": name, "stored_at": time.time()}
+        self._write(self._key("VALUE", name), meta, json.dumps(value).encode("utf-8"))
@@ -0,0 +1,94 @@
+"""Index of the URLs of the bibliography entries, from .bbl and .bib files."""
+
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+
+logger = logging.getLogger("Bibliography")
+
+# entries start with `\bibitem[label]{key}`, biblatex `\entry{key}` or bibtex `@type{key,`
+BBL_ENTRY_REGEX = r"\\(?:bibitem\s*(?:\[[^\]]*\])?|entry)\s*{(?P<key>[^}]+)}"
+BIB_ENTRY_REGEX = r"@\w+\s*[{(]\s*(?P<key>[^,\s]+)\s*,"
+URL_REGEX = (
+    r"\\url\s*{(?P<url>[^}]+)}"
+    r"|\\href\s*{(?P<href>[^}]+)}"
+    # biblatex: `\verb{url}` then `\verb <url>` on the next line
+    r"|\\verb{url}\s*\\verb\s+(?P<verb>\S+)"
+)
+BIB_URL_FIELD_REGEX = r"\burl\s*=\s*[{\"](?P<field>[^}\"]+)"
+CITE_REGEX = r"\\[a-zA-Z]*cite[a-zA-Z]*\*?(?:\s*\[[^\]]*\]){0,2}\s*{([^}]+)}"
+
+BBL_PATTERN = re.compile(f"{BBL_ENTRY_REGEX}|{URL_REGEX}")
+BIB_PATTERN = re.compile(f"{BIB_ENTRY_REGEX}|{URL_REGEX}|{BIB_URL_FIELD_REGEX}", re.I)
+CITE_PATTERN = re.compile(CITE_REGEX)
+
+
+class BibliographyIndex:
+    """Map of citation key -> URLs, built in a single pass over each file.
+
+    Parsed files are cached by content hash, so that the same bibliography
+    shared by many papers, or the same file read again, is parsed once.
+    """
+
+    def __init__(self, max_cached=1024):
+        self._max_cached = max_cached
+        self._cache = OrderedDict()
+
+    def _parse(self, content, pattern):
+        urls = {}
+        key = None
+        for match in pattern.finditer(content):
+            if match["key"]:
+                key = match["key"].strip()
+                continue
+            url = match["url"] or match["href"] or match["verb"] or match.groupdict().get("field")
+            if key and url:
+                urls.setdefault(key, []).append(url.strip())
+        # the same URL is often both in `url` and `howpublished`
+        return {key: list(dict.fromkeys(key_urls)) for key, key_urls in urls.items()}
+
+    def index_file(self, filepath):
+        """Return the map of citation key -> URLs of a .bbl or .bib file."""
+        try:
+            with open(filepath, "rb") as file:
+                content = file.read()
+        except OSError:
+            logger.error(f"Failed to open file {filepath}")
+            return {}
+
+        digest = hashlib.sha256(content).hexdigest()
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+
+        pattern = BIB_PATTERN if str(filepath).endswith(".bib") else BBL_PATTERN
+        urls = self._parse(content.decode("utf-8", errors="replace"), pattern)
+        self._cache[digest] = urls
+        if len(self._cache) > self._max_cached:
+            self._cache.popitem(last=False)
+        return urls
+
+    def index_files(self, filepaths):
+        """Return the map of citation key -> URLs of many files."""
+        urls = {}
+        for filepath in filepaths:
+            urls.update(self.index_file(filepath))
+        return urls
+
+    def substitute_cites(self, text, urls):
+        """Replace the citations with the URLs of their entries.
+
+        The keys without URLs of a multiple citation are kept in a `\\cite`.
+        """
+
+        def _replace(match):
+            keys = [key.strip() for key in match.group(1).split(",")]
+            if not any(key in urls for key in keys):
+                return match.group(0)
+            replaced = [url for key in keys for url in urls.get(key, [])]
+            if others := [key for key in keys if key not in urls]:
+                replaced.append(f"\\cite{{{','.join(others)}}}")
+            return " ".join(replaced)
+
+        return CITE_PATTERN.sub(_replace, text)
@@ -1,117 +1,256 @@
 import glob
 import logging
+import multiprocessing
 import os
 import re
+import time
+from functools import partial
+
+from ..metrics import metrics, timed
+from .bibliography import BibliographyIndex
 
 logger = logging.getLogger("Latex Merger")
 
-BIBITEM_REGEX = r"\\bibitem{([^}]+)}([\s\S]*?)\\bibitem{[^}]+}"
-BIBITEM_URL_REGEX = r"\\url{([^}]+)}"
-CITE_REGEX = r"\\cite{([^}]+)}"
+DOCUMENTCLASS_REGEX = r"^[^%\n]*\\documentclass"
+# `\input{file}`, `\include{file}`, `\subfile{file}`, `\input file`, and the
+# `\import{dir}{file}` forms of the import package
+INPUT_REGEX = (
+    r"\\(?:input|include|subfile)\s*{([^}]+)}"
+    r"|\\input\s+([^\s{}\\%]+)"
+    r"|\\(?:sub)?(?:import|inputfrom|includefrom)\*?\s*{([^}]*)}\s*{([^}]+)}"
+)
+COMMENT_REGEX = r"(?<!\\)%"
+# a `\cite` whose keys continue on the next lines
+OPEN_CITE_REGEX = r"\\[a-zA-Z]*cite[a-zA-Z]*\*?(?:\s*\[[^\]]*\]){0,2}\s*{[^}]*$"
+PREAMBLE_SIZE = 64 * 1024
+# lines joined at most for a `\cite`, in case its brace is never closed
+MAX_CITE_LINES = 20
+
+DOCUMENTCLASS_PATTERN = re.compile(DOCUMENTCLASS_REGEX, re.M)
+INPUT_PATTERN = re.compile(INPUT_REGEX)
+COMMENT_PATTERN = re.compile(COMMENT_REGEX)
+OPEN_CITE_PATTERN = re.compile(OPEN_CITE_REGEX)
+
+
+def _merge_one(input_folder, dir):
+    """Merge a paper in a process of the pool, the corpus stays in the parent."""
+    return dir, LatexMerger(input_folder)._merge_dir(os.path.join(input_folder, dir))
 
 
 class LatexMerger:
-    def __init__(self, input_folder="sources"):
+    """Merge the Latex files of each paper into one `merged.tex`.
+
+    The merge starts from the main document, the one with `\\documentclass`,
+    and follows its `\\input`, `\\include`, `\\subfile` and `\\import` in
+    order, so that each file is written once, where it is used. The files
+    not reached from the main document are appended after it, so that
+    their URLs are not lost to unusual inclusions. The `\\cite` of bibitems
+    with URLs are replaced by the URLs while writing.
+
+    Papers are merged end-to-end in a pool of `workers` processes. With a
+    `CorpusStore`, the papers to merge are queried from it instead of listing
+    the folder, and the merged texts are stored in it.
+    """
+
+    # class attribute, not pickled with the instance: one per process of the pool
+    _bibliography = BibliographyIndex()
+
+    def __init__(self, input_folder="sources", workers=None, corpus=None):
         self._input_folder = input_folder
+        self._workers = workers
+        self._corpus = corpus
 
     def clean(self):
         """Remove all merged tex files."""
         logger.info(f"Deleting all `merged.tex` from {self._input_folder}")
-        for dir in os.listdir(self._input_folder):
+        if self._corpus:
+            dirs = self._corpus.reset("latex", self._corpus.DOWNLOADED)
+        else:
+            dirs = os.listdir(self._input_folder)
+        for dir in dirs:
             merged_filepath = os.path.join(self._input_folder, dir, "merged.tex")
             if os.path.exists(merged_filepath):
                 os.remove(merged_filepath)
         logger.info("Done!")
 
-    def _merge(self, input_folder):
-        """Merge multiple latex file into one single file."""
-        dirs = os.listdir(self._input_folder)
-        total = len(dirs)
-        logger.info(f"Merging the content of {total} Latex")
+    def _main_filepath(self, latex_filepaths):
+        """Return the main document, the top-level file with `\\documentclass`."""
+        candidates = []
+        for latex_filepath in latex_filepaths:
+            with open(latex_filepath, "r", errors="replace") as input_file:
+                # the preamble is at the beginning, no need to read the whole file
+                if DOCUMENTCLASS_PATTERN.search(input_file.read(PREAMBLE_SIZE)):
+                    candidates.append(latex_filepath)
+        if not candidates:
+            return None
+        # standalone figures also have a `\documentclass`, usually in subfolders
+        return min(candidates, key=lambda path: (path.count(os.sep), path))
 
-        merged_dirs = []
-        i = 0
-        for dir in dirs:
-            merged_filepath = os.path.join(input_folder, dir, "merged.tex")
-            if os.path.exists(merged_filepath):
-                # already done
+    def _input_name(self, match):
+        """Return the file of an `INPUT_PATTERN` match, with its folder for `\\import`."""
+        if match.group(4):
+            return os.path.join(match.group(3).strip(), match.group(4).strip())
+        return (match.group(1) or match.group(2)).strip()
+
+    def _resolve(self, folder_path, latex_filepath, name):
+        """Return the path of an `\\input` file, in the paper folder.
+
+        Relative to the paper folder, or to the including file, as with
+        `\\subfile` and `\\subimport`.
+        """
+        for base_path in (folder_path, os.path.dirname(latex_filepath)):
+            filepath = os.path.normpath(os.path.join(base_path, name))
+            if not filepath.startswith(os.path.normpath(folder_path) + os.sep):
                 continue
+            if not filepath.endswith(".tex") and os.path.isfile(f"{filepath}.tex"):
+                return f"{filepath}.tex"
+            if os.path.isfile(filepath):
+                return filepath
+        return None
 
-            merged_dirs.append(dir)
-            i += 1
-            logger.debug(f"Merging Latex content {i}/{total}")
+    def _code(self, line):
+        """Return the line without its comment."""
+        # the lookbehind of the pattern is slow on long lines without any `%`
+        if "%" not in line:
+            return line
+        comment = COMMENT_PATTERN.search(line)
+        return line[: comment.start()] if comment else line
 
-            tex_filespath = os.path.join(input_folder, dir, "**", "*.tex")
-            all_latex_filepaths = glob.glob(tex_filespath, recursive=True)
-            # Do not create file if there are no latex files within the directory
-            if not all_latex_filepaths:
-                logging.debug(f"This directory has no latex files within it, skipping it {dir}")
+    def _lines(self, input_file):
+        """Yield the lines of a file, the lines of a `\\cite` spanning many joined."""
+        lines = ""
+        code = ""
+        for line in input_file:
+            if not lines and "cite" not in line:
+                yield line
                 continue
-            with open(merged_filepath, "w") as output:
-                for latex_filepath in all_latex_filepaths:
-                    with open(latex_filepath, "r", errors="replace") as input_file:
-                        output.write(input_file.read() + "\n")
-        return merged_dirs
-
-    def _get_citation_url(self, bbl_file):
-        """Parse a BBL file and return a map of `bibitem key` -> `url`."""
-        try:
-            with open(bbl_file, "r") as file:
-                content = file.read()
-        except Exception as e:
-            logging.error(f" _get_citation_url: Failed to open file {bbl_file}")
-            return None
+            lines += line
+            code += self._code(line)
+            if OPEN_CITE_PATTERN.search(code) and lines.count("\n") < MAX_CITE_LINES:
+                continue
+            yield lines
+            lines = ""
+            code = ""
+        if lines:
+            yield lines
 
-        citation_data = {}
-        for _match in re.finditer(BIBITEM_REGEX, content):
-            bibitem_key = _match.group(1)
-            bibitem_content = _match.group(2)
+    def _write_file(self, output, folder_path, latex_filepath, citation_urls, written):
+        """Write a Latex file, with its `\\input` files inlined recursively."""
+        written.add(latex_filepath)
+        with open(latex_filepath, "r", errors="replace") as input_file:
+            for line in self._lines(input_file):
+                # inputs in comments are not followed
+                code = self._code(line)
+                start = 0
+                for match in INPUT_PATTERN.finditer(code):
+                    filepath = self._resolve(folder_path, latex_filepath, self._input_name(match))
+                    if not filepath or filepath in written:
+                        continue
+                    text = line[start : match.start()]
+                    output.write(self._bibliography.substitute_cites(text, citation_urls) + "\n")
+                    self._write_file(output, folder_path, filepath, citation_urls, written)
+                    start = match.end()
+                output.write(self._bibliography.substitute_cites(line[start:], citation_urls))
+        output.write("\n")
 
-            inner_match = re.search(BIBITEM_URL_REGEX, bibitem_content)
-            url = inner_match.group(1) if inner_match else None
+    def _merge_dir(self, folder_path):
+        """Merge the Latex files of a paper, return the merged size or None when there are none.
 
-            if url:
-                citation_data[bibitem_key] = url
+        `merged.tex` is written atomically, so that interrupted merges are not
+        considered done by the next run.
+        """
+        tex_filespath = os.path.join(folder_path, "**", "*.tex")
+        all_latex_filepaths = sorted(glob.glob(tex_filespath, recursive=True))
+        # Do not create file if there are no latex files within the directory
+        if not all_latex_filepaths:
+            return None
 
-        return citation_data
+        # .bbl last, generated from the .bib they take precedence
+        bibliography_filepaths = []
+        for extension in ("bib", "bbl"):
+            filespath = os.path.join(folder_path, "**", f"*.{extension}")
+            bibliography_filepaths.extend(sorted(glob.glob(filespath, recursive=True)))
+        citation_urls = self._bibliography.index_files(bibliography_filepaths)
 
-    def _replace_cite_with_bibitem(self, merged_tex, citation_data):
-        """Replace `cite` with the `bibitem url`."""
-        if not os.path.exists(merged_tex):
-            logging.warning(f"_replace_cite_with_bibitem: Merged file does not exist for: {merged_tex}")
-            return
+        main_filepath = self._main_filepath(all_latex_filepaths)
+        merged_filepath = os.path.join(folder_path, "merged.tex")
+        tmp_filepath = f"{merged_filepath}.part"
+        with open(tmp_filepath, "w") as output:
+            written = set()
+            if main_filepath:
+                self._write_file(output, folder_path, main_filepath, citation_urls, written)
+            else:
+                logger.debug("No main document in %s, merging all Latex files", folder_path)
+            # the files not reached from the main document, if any
+            for latex_filepath in all_latex_filepaths:
+                if latex_filepath not in written:
+                    self._write_file(output, folder_path, latex_filepath, citation_urls, written)
+        os.replace(tmp_filepath, merged_filepath)
+        return os.path.getsize(merged_filepath)
 
-        with open(merged_tex, "r") as file:
-            tex_content = file.read()
+    def _timed(self, merged):
+        for result, elapsed in merged:
+            metrics.observe("merge_seconds", elapsed)
+            yield result
 
-        tex_content = re.sub(
-            CITE_REGEX,
-            lambda match: citation_data.get(match.group(1), match.group(0)),
-            tex_content,
-        )
+    def _merge_dirs(self, dirs):
+        # timed in the processes, recorded here; the instance is not pickled,
+        # its corpus connection cannot be
+        merge_one = partial(timed, _merge_one, self._input_folder)
+        if self._workers == 1:
+            yield from self._timed(map(merge_one, dirs))
+            return
 
-        # Optionally, save the modified content back to merged.tex
-        with open(merged_tex, "w") as file:
-            file.write(tex_content)
+        with multiprocessing.Pool(self._workers) as pool:
+            yield from self._timed(pool.imap_unordered(merge_one, dirs, chunksize=8))
 
-    def _embed_bbl(self, input_folder, merged_dirs):
-        """Replace the \cite in the latex template with the bbl"""
-        for dir in merged_dirs:
-            merged_filepath = os.path.join(input_folder, dir, "merged.tex")
-            bbls_filespath = os.path.join(input_folder, dir, "**", "*.bbl")
+    def _store(self, dir):
+        """Store the merged text in the corpus."""
+        with open(os.path.join(self._input_folder, dir, "merged.tex")) as fp:
+            self._corpus.set_text(dir, "latex", fp.read())
 
-            # extra citations
-            citation_urls = {}
-            for bbl_filepath in glob.glob(bbls_filespath, recursive=True):
-                if citation_url := self._get_citation_url(bbl_filepath):
-                    citation_urls.update(citation_url)
-            # Process the merged.tex file to replace \cite with \bibitem
-            self._replace_cite_with_bibitem(merged_filepath, citation_urls)
+    def _pending(self):
+        if not self._corpus:
+            return [
+                dir
+                for dir in os.listdir(self._input_folder)
+                # already done
+                if not os.path.exists(os.path.join(self._input_folder, dir, "merged.tex"))
+            ]
+
+        dirs = []
+        for dir in self._corpus.pending("latex", self._corpus.DOWNLOADED):
+            if os.path.exists(os.path.join(self._input_folder, dir, "merged.tex")):
+                # merged before the corpus existed
+                self._store(dir)
+            else:
+                dirs.append(dir)
+        return dirs
 
     def run(self):
         """Merge all .tex into one and replace inline all bibitem urls."""
-        merged_dirs = self._merge(self._input_folder)
-        if merged_dirs:
-            logger.info("Embedding all citations")
-            self._embed_bbl(self._input_folder, merged_dirs)
+        dirs = self._pending()
+        total = len(dirs)
+        logger.info(f"Merging the content of {total} Latex")
+
+        start = time.monotonic()
+        i = 0
+        merged = 0
+        size = 0
+        for dir, merged_size in self._merge_dirs(dirs):
+            i += 1
+            logger.debug("Merging Latex content %d/%d", i, total)
+            if merged_size is not None:
+                merged += 1
+                size += merged_size
+                if self._corpus:
+                    self._store(dir)
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        logger.info(
+            f"Merged {merged}/{total} Latex in {elapsed:.1f}s: {i / elapsed:.1f} papers/s, "
+            f"{size / elapsed / 1024 / 1024:.1f} MB/s"
+        )
+        if merged < total:
+            logger.debug(f"{total - merged} directories have no latex files within them")
         logger.info("Done!")
@@ -1,9 +1,37 @@
+import atexit
+import gzip
 import logging
+import multiprocessing
 import os
+import shutil
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+LOG_MAX_BYTES = 100 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
 
-def setup_logger():
+
+def _gzip_namer(name):
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source, dest):
+    """Compress the rotated log file."""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def setup_logger(level="INFO", max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    """Log to the console and to a file in `logs`, from a background thread.
+
+    Records are put in a queue and written by a listener thread, so that
+    the workers do not wait for the disk or the terminal. The records are
+    still formatted by the threads logging them, and pickled through the
+    pipe of a process queue, which the processes of the pools share: the
+    hot paths should only log at enabled levels, or lazily. The log file is
+    rotated every `max_bytes`, the `backup_count` previous files gzipped.
+    """
     log_folder = "logs"
     os.makedirs(log_folder, exist_ok=True)
 
@@ -11,7 +39,7 @@ def setup_logger():
     log_file = os.path.join(log_folder, f"log_{timestamp}.log")
 
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
 
     # Disable logging for urllib3.connectionpool
     urllib3_logger = logging.getLogger("urllib3")
@@ -21,15 +49,22 @@ def setup_logger():
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
 
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.DEBUG)
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count
+    )
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
     file_handler.setFormatter(formatter)
 
     stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.DEBUG)
     stream_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    # a process queue, for the logs of the pools of processes forked after
+    log_queue = multiprocessing.Queue(-1)
+    listener = QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(log_queue))
 
     return logger
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("Manifest")
+
+ARXIV_VERSION_REGEX = r"^(.+?)(v\d+)?$"
+
+
+def split_version(arxiv_id):
+    """Split `2301.12169v1` into `("2301.12169", "v1")`."""
+    match = re.match(ARXIV_VERSION_REGEX, arxiv_id)
+    return match.group(1), match.group(2) or ""
+
+
+class DownloadManifest:
+    """Persistent record of the downloaded ArXiV files.
+
+    Each update is appended as one JSON line, the last line of a given
+    `arxiv_id` and `kind` wins when loading. This keeps writes cheap and
+    survives interrupted runs, the file is compacted at the end of the runs.
+    """
+
+    DONE = "done"
+    PARTIAL = "partial"
+    FAILED = "failed"
+
+    def __init__(self, filepath="manifest.jsonl"):
+        self._filepath = filepath
+        self._entries = {}
+        # lines of the file, more than the entries when some are outdated
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._filepath):
+            return
+        with open(self._filepath) as fp:
+            for line in fp:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # truncated last line of an interrupted run
+                    continue
+                self._entries[(entry["arxiv_id"], entry["kind"])] = entry
+        logger.debug(f"Loaded {len(self._entries)} entries from {self._filepath}")
+
+    def get(self, arxiv_id, kind):
+        return self._entries.get((arxiv_id, kind))
+
+    def is_done(self, arxiv_id, kind):
+        entry = self.get(arxiv_id, kind)
+        return bool(entry) and entry["status"] == self.DONE
+
+    def done(self):
+        """Return the `(arxiv_id, kind)` of all the files downloaded."""
+        return [key for key, entry in self._entries.items() if entry["status"] == self.DONE]
+
+    def update(self, arxiv_id, kind, status, size=None, checksum=None):
+        """Record the current status of a downloaded file."""
+        _id, version = split_version(arxiv_id)
+        entry = {
+            "arxiv_id": arxiv_id,
+            "id": _id,
+            "version": version,
+            "kind": kind,
+            "size": size,
+            "sha256": checksum,
+            "status": status,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._entries[(arxiv_id, kind)] = entry
+            self._lines += 1
+            with open(self._filepath, "a") as fp:
+                fp.write(json.dumps(entry) + "\n")
+        return entry
+
+    def compact(self):
+        """Rewrite the manifest keeping only the latest entry of each file, if outdated."""
+        with self._lock:
+            if self._lines <= len(self._entries):
+                return
+            tmp_filepath = f"{self._filepath}.tmp"
+            with open(tmp_filepath, "w") as fp:
+                for entry in self._entries.values():
+                    fp.write(json.dumps(entry) + "\n")
+            os.replace(tmp_filepath, self._filepath)
+            logger.debug(f"Compacted {self._filepath}: {self._lines} to {len(self._entries)} lines")
+            self._lines = len(self._entries)
@@ -0,0 +1,243 @@
+"""Counters and histograms of the stages, with reports, periodic dumps and profiling."""
+
+import bisect
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("Metrics")
+
+PROMETHEUS_PREFIX = "bidir_"
+# in seconds, from regex scans of small papers to Tika extractions of huge PDFs
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+def timed(func, *args):
+    """Call `func`, return its result and duration, to time the work of other processes."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket of the quantile `q`."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """Thread-safe counters and histograms, by name and labels.
+
+    Work done in pools of processes is not recorded by the processes, but
+    by the caller with the durations they return, see `timed`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._started = time.monotonic()
+        self._dump_thread = None
+        self._stop = threading.Event()
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started = time.monotonic()
+
+    def snapshot(self):
+        """Return all the metrics, as JSON serializable values."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {"elapsed": elapsed, "counters": counters, "histograms": histograms}
+
+    def _labels(self, labels, **more):
+        labels = {**labels, **more}
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot["counters"]:
+            name = PROMETHEUS_PREFIX + counter["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = PROMETHEUS_PREFIX + histogram["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                labels = self._labels(histogram["labels"], le=bound)
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = self._labels(histogram["labels"])
+            lines.append(f"{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filepath):
+        """Write the metrics atomically, in the Prometheus format for `.prom` files, else JSON."""
+        if filepath.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        tmp_filepath = f"{filepath}.part"
+        with open(tmp_filepath, "w") as fp:
+            fp.write(content)
+        os.replace(tmp_filepath, filepath)
+
+    def start_dumping(self, filepath, interval=30):
+        """Dump the metrics every `interval` seconds, in a background thread."""
+
+        def _dump():
+            while not self._stop.wait(interval):
+                self.dump(filepath)
+
+        self._stop.clear()
+        self._dump_thread = threading.Thread(target=_dump, name="metrics-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self, filepath):
+        """Stop the periodic dumps, with a last one."""
+        self._stop.set()
+        if self._dump_thread:
+            self._dump_thread.join()
+            self._dump_thread = None
+        self.dump(filepath)
+
+    def summary(self):
+        """Return the report of all the metrics, one line per counter or histogram."""
+        snapshot = self.snapshot()
+        elapsed = max(snapshot["elapsed"], 1e-6)
+        lines = []
+        for counter in snapshot["counters"]:
+            name = counter["name"] + self._labels(counter["labels"])
+            lines.append(f"{name}: {counter['value']} ({counter['value'] / elapsed:.1f}/s)")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"] + self._labels(histogram["labels"])
+            mean = histogram["sum"] / histogram["count"]
+            lines.append(
+                f"{name}: {histogram['count']} in {histogram['sum']:.2f}s, mean {mean:.3f}s, "
+                f"p50 <= {histogram['p50']:.3f}s, p95 <= {histogram['p95']:.3f}s, "
+                f"max {histogram['max']:.3f}s"
+            )
+        return lines
+
+    def log_summary(self):
+        for line in self.summary():
+            logger.info(line)
+
+
+@contextlib.contextmanager
+def profile(stage, profiler="cprofile", folder="profiles"):
+    """Profile the calling thread, write the profile of `stage` in `folder`.
+
+    The threads and processes of the pools are not profiled: for the
+    commands running the stages in pools, the profile is mostly waits on
+    their results, the time of each stage is in the metrics.
+
+    cProfile profiles are `.prof` files, to open with `pstats` or snakeviz;
+    pyinstrument (optional dependency) profiles are HTML pages.
+    """
+    os.makedirs(folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    filepath = os.path.join(folder, f"{stage}_{timestamp}")
+
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        instrument = Profiler()
+        instrument.start()
+        try:
+            yield
+        finally:
+            instrument.stop()
+            with open(f"{filepath}.html", "w") as fp:
+                fp.write(instrument.output_html())
+            logger.info(f"Profile of {stage} written to {filepath}.html")
+        return
+
+    cprofile = cProfile.Profile()
+    cprofile.enable()
+    try:
+        yield
+    finally:
+        cprofile.disable()
+        cprofile.dump_stats(f"{filepath}.prof")
+        logger.info(f"Profile of {stage} written to {filepath}.prof")
+
+
+metrics = Metrics()
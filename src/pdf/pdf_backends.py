@@ -0,0 +1,223 @@
+"""Backends extracting the content of a PDF, used by `PDFExtractor`."""
+
+import logging
+import queue
+import re
+import time
+
+import tika.tika
+from tika import parser
+
+from ..metrics import metrics
+from ..repos_finder import ReposFinder
+
+logger = logging.getLogger("PDF backends")
+
+# the Tika servers are expected to be already running: never download and
+# start one, read by `tika.tika`, not by the package
+tika.tika.TikaClientOnly = True
+
+# outline sections where repos URLs are usually found
+TARGETED_SECTIONS_REGEX = re.compile(
+    r"availab|artifact|artefact|code|data|software|supplementa|reproduc|appendix|references|bibliography",
+    re.I,
+)
+
+
+class ExtractionError(Exception):
+    def __init__(self, message, retry=True):
+        self.retry = retry
+        super().__init__(message)
+
+
+class PDFBackend:
+    """Extract the content of a PDF.
+
+    `processes` tells if the backend is CPU bound, to run in a pool of
+    processes, or I/O bound, to run in a pool of `workers` threads.
+    """
+
+    processes = False
+    workers = 1
+
+    def extract(self, pdf_filepath):
+        """Return the text of the PDF, raise `ExtractionError` on failures."""
+        raise NotImplementedError
+
+
+class TikaBackend(PDFBackend):
+    """Extract with a pool of Tika servers.
+
+    Each server handles at most `concurrency` PDFs at once. Failed requests
+    are retried on the next free server.
+    """
+
+    RETRY_SLEEP_TIME = 2
+
+    def __init__(
+        self, server_urls="http://127.0.0.1:9998", concurrency=2, timeout=300, retries=2
+    ):
+        if isinstance(server_urls, str):
+            server_urls = [server_urls]
+        self._timeout = timeout
+        self._retries = retries
+        # one entry per available slot of each server
+        self._servers = queue.Queue()
+        for _ in range(concurrency):
+            for server_url in server_urls:
+                self._servers.put(server_url)
+        self.workers = self._servers.qsize()
+
+    def _parse(self, pdf_filepath, server_url):
+        """Extract the content of a PDF with a given Tika server."""
+        try:
+            with metrics.timer("tika_seconds", server=server_url):
+                parsed = parser.from_file(
+                    pdf_filepath, server_url, requestOptions={"timeout": self._timeout}
+                )
+        except ValueError as e:
+            # unexpected response, not JSON
+            raise ExtractionError(f"Invalid response: {e}")
+        except Exception as e:
+            # connection errors, or any other error of tika-python: fail this PDF only
+            raise ExtractionError(f"{type(e).__name__}: {e}")
+
+        status = parsed.get("status")
+        if status in (415, 422):
+            # unsupported or corrupted PDF, another attempt would fail the same way
+            raise ExtractionError(f"Tika status {status}", retry=False)
+        if status != 200:
+            raise ExtractionError(f"Tika status {status}")
+        return parsed["content"] or ""
+
+    def extract(self, pdf_filepath):
+        """Extract a PDF with the next free server, retrying on failures."""
+        for attempt in range(self._retries + 1):
+            server_url = self._servers.get()
+            try:
+                return self._parse(pdf_filepath, server_url)
+            except ExtractionError as e:
+                logger.warning(
+                    f"Cannot extract `{pdf_filepath}` with {server_url}, attempt {attempt + 1}: {e}"
+                )
+                if not e.retry or attempt == self._retries:
+                    raise ExtractionError(
+                        f"{e} ({server_url}, {attempt + 1} attempts)", retry=e.retry
+                    )
+            finally:
+                self._servers.put(server_url)
+            time.sleep(self.RETRY_SLEEP_TIME * 2**attempt)
+
+
+class PyPDFBackend(PDFBackend):
+    """Extract in-process with `pypdf`, in a pool of processes.
+
+    With `links_only`, only the URIs of the link annotations are returned,
+    much faster than the text layout. URLs only written in the text, not
+    clickable, are missed.
+
+    With `targeted`, the pages where repos URLs usually are, are extracted
+    first: the first pages, with the footnotes of the introduction, the
+    outline sections such as "Data availability" or "Artifact", and the
+    last pages, with the references. The other pages are extracted only
+    when no repo URL is found in these.
+    """
+
+    processes = True
+    FIRST_PAGES = 2
+    LAST_PAGES = 3
+
+    def __init__(self, links_only=False, targeted=False, workers=None):
+        # fail early, not in the processes of the pool
+        import pypdf  # noqa: F401
+
+        self._links_only = links_only
+        self._targeted = targeted
+        self.workers = workers
+
+    def _links(self, reader):
+        links = []
+        for page in reader.pages:
+            for annotation in page.get("/Annots") or []:
+                annotation = annotation.get_object()
+                action = annotation.get("/A")
+                if action and (uri := action.get_object().get("/URI")):
+                    links.append(str(uri))
+        return "\n".join(links)
+
+    def _outline_pages(self, reader):
+        """Return the pages of the outline sections matching `TARGETED_SECTIONS_REGEX`."""
+        items = []
+        stack = list(reader.outline)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+                continue
+            page = reader.get_destination_page_number(item)
+            if page is not None:
+                items.append((page, item.title or ""))
+        items.sort()
+
+        pages = []
+        for i, (page, title) in enumerate(items):
+            if TARGETED_SECTIONS_REGEX.search(title):
+                # the section ends on the page where the next one starts
+                end = items[i + 1][0] if i + 1 < len(items) else page
+                pages.extend(range(page, max(page, end) + 1))
+        return pages
+
+    def _targeted_pages(self, reader):
+        """Return the groups of pages to extract, in order."""
+        total = len(reader.pages)
+        try:
+            sections = self._outline_pages(reader)
+        except Exception:
+            # broken outlines are common, the other pages are still targeted
+            sections = []
+        return [
+            range(min(self.FIRST_PAGES, total)),
+            sections,
+            range(max(total - self.LAST_PAGES, 0), total),
+        ]
+
+    def _extract_targeted(self, reader, pdf_filepath):
+        repos_finder = ReposFinder()
+        texts = {}
+        links = self._links(reader)
+        for pages in self._targeted_pages(reader):
+            for number in pages:
+                if number not in texts:
+                    texts[number] = reader.pages[number].extract_text()
+            text = "\n".join([links] + [texts[number] for number in sorted(texts)])
+            if text and any(repos_finder.find(pdf_filepath, text).values()):
+                logger.debug(
+                    f"Repos URLs found in `{pdf_filepath}` extracting {len(texts)}/{len(reader.pages)} pages"
+                )
+                return text
+
+        # nothing found, fall back to the full document
+        for number, page in enumerate(reader.pages):
+            if number not in texts:
+                texts[number] = page.extract_text()
+        return "\n".join(texts[number] for number in sorted(texts))
+
+    def extract(self, pdf_filepath):
+        import pypdf
+
+        try:
+            reader = pypdf.PdfReader(pdf_filepath)
+            if self._links_only:
+                return self._links(reader)
+            if self._targeted:
+                return self._extract_targeted(reader, pdf_filepath)
+            return "\n".join(page.extract_text() for page in reader.pages)
+        except Exception as e:
+            # malformed PDFs raise all kinds of errors in pypdf
+            raise ExtractionError(f"{type(e).__name__}: {e}", retry=False)
+
+
+BACKENDS = {
+    "tika": TikaBackend,
+    "pypdf": PyPDFBackend,
+}
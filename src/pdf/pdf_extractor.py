@@ -1,47 +1,144 @@
 import glob
+import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-from tika import unpack
+from ..metrics import metrics, timed
+from .pdf_backends import ExtractionError, TikaBackend
 
 logger = logging.getLogger("PDF Extractor")
 
 
+def _extract_dir(backend, input_folder, dir):
+    """Extract all the PDFs of a paper, write `extracted.txt` atomically.
+
+    PDFs failing for good, e.g. corrupted, are skipped. On other failures,
+    e.g. of a server, the paper is not written, to be retried by the next
+    run. Return the failures, the paper is extracted unless one of them is
+    to `retry`. A module function, to run in a pool of processes.
+    """
+    pdf_filepaths = os.path.join(input_folder, dir, "**", "*.pdf")
+    contents = []
+    failures = []
+    for pdf_filepath in glob.glob(pdf_filepaths, recursive=True):
+        try:
+            content = backend.extract(pdf_filepath)
+        except ExtractionError as e:
+            failures.append({"dir": dir, "pdf": pdf_filepath, "error": str(e), "retry": e.retry})
+            if e.retry:
+                return failures
+            continue
+        if content:
+            contents.append(content + "\n")
+
+    extracted_filepath = os.path.join(input_folder, dir, "extracted.txt")
+    tmp_filepath = f"{extracted_filepath}.part"
+    with open(tmp_filepath, "w") as output:
+        output.writelines(contents)
+    os.replace(tmp_filepath, extracted_filepath)
+    return failures
+
+
 class PDFExtractor:
+    """Extract the PDFs content with a backend, Tika servers by default.
+
+    Papers are extracted concurrently, in threads or processes depending
+    on the backend. PDFs failing are logged in `failures_filepath`. The
+    `extracted.txt` of a paper is written only when all its PDFs are
+    extracted or failed for good, so that the papers failed because of the
+    servers are retried by the next run.
+
+    With a `CorpusStore`, the papers to extract are queried from it instead
+    of listing the folder, and the extracted texts are stored in it.
+    """
+
     def __init__(
-        self, tika_server_url="http://127.0.0.1:9998/tika", input_folder="pdfs"
+        self,
+        backend=None,
+        input_folder="pdfs",
+        failures_filepath="extract_failures.jsonl",
+        corpus=None,
     ):
-        self._tika_server_url = tika_server_url
+        self._backend = backend or TikaBackend()
         self._input_folder = input_folder
+        self._failures_filepath = failures_filepath
+        self._corpus = corpus
 
     def clean(self):
         """Deleted all `extracted.txt` files."""
         logger.info(f"Deleting all `extracted.txt` from {self._input_folder}")
-        for dir in os.listdir(self._input_folder):
+        if self._corpus:
+            dirs = self._corpus.reset("pdf", self._corpus.DOWNLOADED)
+        else:
+            dirs = os.listdir(self._input_folder)
+        for dir in dirs:
             extracted_filepath = os.path.join(self._input_folder, dir, "extracted.txt")
             if os.path.exists(extracted_filepath):
                 os.remove(extracted_filepath)
         logger.info("Done!")
 
+    def _log_failure(self, failure):
+        failure["failed_at"] = datetime.now().isoformat(timespec="seconds")
+        with open(self._failures_filepath, "a") as fp:
+            fp.write(json.dumps(failure) + "\n")
+
+    def _executor(self):
+        if self._backend.processes:
+            return ProcessPoolExecutor(max_workers=self._backend.workers)
+        return ThreadPoolExecutor(max_workers=self._backend.workers)
+
+    def _store(self, dir):
+        """Store the extracted text in the corpus."""
+        with open(os.path.join(self._input_folder, dir, "extracted.txt")) as fp:
+            self._corpus.set_text(dir, "pdf", fp.read())
+
+    def _pending(self):
+        if not self._corpus:
+            return [
+                dir
+                for dir in os.listdir(self._input_folder)
+                if not os.path.exists(os.path.join(self._input_folder, dir, "extracted.txt"))
+            ]
+
+        dirs = []
+        for dir in self._corpus.pending("pdf", self._corpus.DOWNLOADED):
+            if os.path.exists(os.path.join(self._input_folder, dir, "extracted.txt")):
+                # extracted before the corpus existed
+                self._store(dir)
+            else:
+                dirs.append(dir)
+        return dirs
+
     def run(self):
-        """Extract all PDFs content in `extracted.txt` file, using Tika."""
-        dirs = os.listdir(self._input_folder)
+        """Extract all PDFs content in `extracted.txt` file."""
+        dirs = self._pending()
         total = len(dirs)
-        logger.info(f"Extracting the content of {total} PDFs")
+        logger.info(
+            f"Extracting the content of {total} PDFs with {type(self._backend).__name__}"
+        )
 
         i = 0
-        for dir in dirs:
-            extracted_filepath = os.path.join(self._input_folder, dir, "extracted.txt")
-            if os.path.exists(extracted_filepath):
-                # already done
-                continue
-
-            i += 1
-            logger.debug(f"Extracting PDF content of `{dir}` | {i}/{total}")
-            pdf_filepaths = os.path.join(self._input_folder, dir, "**", "*.pdf")
-            with open(extracted_filepath, "w") as output:
-                for pdf_filepath in glob.glob(pdf_filepaths, recursive=True):
-                    parsed = unpack.from_file(pdf_filepath, self._tika_server_url)
-                    if parsed and parsed["content"]:
-                        output.write(parsed["content"] + "\n")
+        failed = 0
+        backend = type(self._backend).__name__
+        with self._executor() as executor:
+            futures = {
+                executor.submit(timed, _extract_dir, self._backend, self._input_folder, dir): dir
+                for dir in dirs
+            }
+            for future in as_completed(futures):
+                i += 1
+                failures, elapsed = future.result()
+                metrics.observe("extract_seconds", elapsed, backend=backend)
+                for failure in failures:
+                    failed += 1
+                    logger.warning(f"Cannot extract `{failure['pdf']}`: {failure['error']}")
+                    self._log_failure(failure)
+                if self._corpus and not any(failure["retry"] for failure in failures):
+                    self._store(futures[future])
+                logger.debug("Extracted PDF content of `%s` | %d/%d", futures[future], i, total)
+
+        if failed:
+            logger.error(f"{failed} PDFs not extracted, see `{self._failures_filepath}`")
         logger.info("Done!")
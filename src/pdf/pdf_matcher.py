@@ -1,13 +1,12 @@
-import csv
 import glob
 import logging
 import os
 import re
-from datetime import datetime
 
 from ..errors import PDFsExtractedNotFound
-from ..repos_finder import ReposFinder
 from ..pub_finder import PubFinder
+from ..results import ResultsWriter
+from ..scanner import scan_files
 
 logger = logging.getLogger("PDF Matcher")
 
@@ -17,59 +16,77 @@ ARXIV_ID_REGEX = r"/(\d+\.\d+)(?:v\d+)/"
 class PDFMatcher:
     PDFS_FOLDER = "pdfs"
 
-    def __init__(self, github, zenodo):
+    def __init__(
+        self,
+        github,
+        zenodo,
+        workers=None,
+        output="results_pdfs.csv",
+        resume=True,
+        corpus=None,
+    ):
         self._github = github
         self._zenodo = zenodo
+        self._workers = workers
+        self._output = output
+        self._resume = resume
+        self._corpus = corpus
+
+    def _files(self, filepaths, done):
+        """Return the `(arxiv_id, filepath)` of the publications not checked yet."""
+        files = [(re.search(ARXIV_ID_REGEX, filepath)[1], filepath) for filepath in filepaths]
+        return [(arxiv_id, filepath) for arxiv_id, filepath in files if arxiv_id not in done]
+
+    def _repos_ids(self, files):
+        """Yield the repos ids found in each extracted PDF text, scanned in parallel."""
+        i = 0
+        total = len(files)
+        # PDFs cannot be contextualized, given that URLs might be in
+        # footnotes or appendices
+        for arxiv_id, repos_ids in scan_files(
+            files, contextualized=False, workers=self._workers
+        ):
+            i += 1
+            logger.info("Scanned `%s` - %d/%d", arxiv_id, i, total)
+            yield arxiv_id, repos_ids
+
+    def _filepaths(self):
+        """Return the files to scan, from the corpus when given."""
+        if not self._corpus:
+            filepaths = os.path.join(self.PDFS_FOLDER, "**", "extracted.txt")
+            return glob.glob(filepaths, recursive=True)
+
+        if not self._resume:
+            self._corpus.reset("pdf", self._corpus.EXTRACTED)
+        return [
+            os.path.join(self.PDFS_FOLDER, arxiv_id, "extracted.txt")
+            for arxiv_id in self._corpus.pending("pdf", self._corpus.EXTRACTED)
+        ]
+
+    def _store(self, filepaths, found_publis):
+        """Store the results in the corpus, by the versioned ids of the folders."""
+        for filepath in filepaths:
+            arxiv_id = os.path.basename(os.path.dirname(filepath))
+            self._corpus.set_results(arxiv_id, "pdf", found_publis)
 
     def run(self):
-        repos_finder = ReposFinder()
         pub_finder = PubFinder(self._github, self._zenodo)
 
-        extracted_filepaths = os.path.join(self.PDFS_FOLDER, "**", "extracted.txt")
-        filepaths = glob.glob(extracted_filepaths, recursive=True)
+        filepaths = self._filepaths()
         if not filepaths:
             raise PDFsExtractedNotFound()
 
-        results = {}
-        i = 0
-        total = len(filepaths)
-        for filepath in filepaths:
-            i += 1
-            logger.info(f"Working on `{filepath}` - {i}/{total}")
-
-            arxiv_id = re.search(ARXIV_ID_REGEX, filepath)[1]
-            results.setdefault(arxiv_id, {})
-            with open(filepath) as fp:
-                text = fp.read()
-
-                # PDFs cannot be contextualized, given that URLs might be in
-                # footnotes or appendices
-                repos_ids = repos_finder.find(arxiv_id, text, contextualized=False)
-                results[arxiv_id] = pub_finder.find(arxiv_id, repos_ids)
-
+        results = ResultsWriter(self._output, resume=self._resume)
+        files = self._files(filepaths, results.done)
+        files_by_id = {}
+        for arxiv_id, filepath in files:
+            files_by_id.setdefault(arxiv_id, []).append(filepath)
+        logger.info(f"{len(files)} publications to check, writing results to {self._output}")
+        for arxiv_id, found_publis in pub_finder.find_many(self._repos_ids(files)):
+            results.write(arxiv_id, found_publis)
+            if self._corpus:
+                self._store(files_by_id[arxiv_id], found_publis)
+
+        pub_finder.close()
         self._github.close()
-
-        # Dump to a CSV file
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        with open(f"results_pdfs_{timestamp}.csv", mode="w", newline="") as file:
-            writer = csv.writer(file)
-
-            header = [
-                "ArXiV id",
-                "Result",
-                "Where",
-            ]
-            writer.writerow(header)
-
-            for arxiv_id, repos in results.items():
-                found = False
-                for repo, ids in repos.items():
-                    for _id, value in ids.items():
-                        if value == "Found":
-                             found = True
-                             row = [arxiv_id, "Found", f"Repo: {repo} - {str(_id)}"]
-                if not found:
-                    row = [arxiv_id, "Not found", ""]
-
-                writer.writerow(row)
-
+        results.close()
@@ -0,0 +1,206 @@
+"""Stream papers through download, extraction and matching, stages overlapping."""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .latex.latex_merger import LatexMerger
+from .manifest import split_version
+from .metrics import metrics, timed
+from .pdf.pdf_backends import TikaBackend
+from .pdf.pdf_extractor import _extract_dir
+from .pub_finder import PubFinder
+from .results import ResultsWriter
+from .scanner import _scan_file
+
+logger = logging.getLogger("Pipeline")
+
+_DONE = object()
+
+
+class Pipeline:
+    """Run stages concurrently, each in its own threads, with bounded queues between them.
+
+    Each stage function takes an item and returns the item of the next
+    stage, or None to drop it. A full queue blocks the previous stage, so
+    that a slow stage bounds the memory instead of accumulating items.
+    """
+
+    def __init__(self, queue_size=16):
+        self._queue_size = queue_size
+        self._stages = []
+
+    def add_stage(self, name, func, workers=1):
+        self._stages.append((name, func, workers))
+        return self
+
+    def _work(self, name, func, input_queue, output_queue):
+        while (item := input_queue.get()) is not _DONE:
+            try:
+                result = func(item)
+            except Exception:
+                logger.exception(f"Stage `{name}` failed on {item}")
+                continue
+            if result is not None:
+                output_queue.put(result)
+
+    def _close(self, threads, output_queue, next_workers):
+        """When all the threads of a stage are done, stop the next stage."""
+        for thread in threads:
+            thread.join()
+        for _ in range(next_workers):
+            output_queue.put(_DONE)
+
+    def _feed(self, items, input_queue, workers):
+        """Put the items in the first queue, then stop the first stage, even on errors."""
+        try:
+            for item in items:
+                input_queue.put(item)
+        except Exception:
+            logger.exception("Failed to list the items, stopping the pipeline")
+        finally:
+            for _ in range(workers):
+                input_queue.put(_DONE)
+
+    def run(self, items):
+        """Yield the outputs of the last stage, as soon as available."""
+        queues = [queue.Queue(self._queue_size) for _ in range(len(self._stages) + 1)]
+        # threads are daemons: when the caller stops early, they do not block the exit
+        threading.Thread(
+            target=self._feed, args=(items, queues[0], self._stages[0][2]), daemon=True
+        ).start()
+
+        for i, (name, func, workers) in enumerate(self._stages):
+            threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(name, func, queues[i], queues[i + 1]),
+                    name=f"{name}-{j}",
+                    daemon=True,
+                )
+                for j in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+            next_workers = self._stages[i + 1][2] if i + 1 < len(self._stages) else 1
+            threading.Thread(
+                target=self._close, args=(threads, queues[i + 1], next_workers), daemon=True
+            ).start()
+
+        while (item := queues[-1].get()) is not _DONE:
+            yield item
+
+
+class PapersPipeline:
+    """Download, extract or merge, and check the papers of a search query, streamed."""
+
+    def __init__(
+        self,
+        downloader,
+        github,
+        zenodo,
+        source_type,
+        backend=None,
+        download_workers=1,
+        extract_workers=None,
+        queue_size=16,
+        output=None,
+        resume=True,
+    ):
+        self._downloader = downloader
+        self._github = github
+        self._zenodo = zenodo
+        self._source_type = source_type
+        self._backend = backend or TikaBackend()
+        self._download_workers = download_workers
+        self._extract_workers = extract_workers or os.cpu_count()
+        self._queue_size = queue_size
+        self._output = output or (
+            "results_pdfs.csv" if source_type == "pdf" else "results_sources.csv"
+        )
+        self._resume = resume
+
+    def _download(self, arxiv_id):
+        if self._downloader.download_paper(arxiv_id, self._source_type):
+            return arxiv_id
+        return None
+
+    def _extract(self, arxiv_id, executor):
+        """Extract the PDF or merge the Latex, return the file to scan."""
+        if self._source_type == "pdf":
+            folder, filename = self._downloader.PDFS_FOLDER, "extracted.txt"
+        else:
+            folder, filename = self._downloader.SOURCES_FOLDER, "merged.tex"
+        filepath = os.path.join(folder, arxiv_id, filename)
+        if os.path.exists(filepath):
+            return arxiv_id, filepath
+
+        if self._source_type == "pdf":
+            if self._backend.processes:
+                failures, elapsed = executor.submit(
+                    timed, _extract_dir, self._backend, folder, arxiv_id
+                ).result()
+            else:
+                failures, elapsed = timed(_extract_dir, self._backend, folder, arxiv_id)
+            metrics.observe("extract_seconds", elapsed, backend=type(self._backend).__name__)
+            for failure in failures:
+                logger.error(f"Cannot extract `{failure['pdf']}`: {failure['error']}")
+            if any(failure["retry"] for failure in failures):
+                return None
+        else:
+            merger = LatexMerger(folder)
+            size, elapsed = executor.submit(
+                timed, merger._merge_dir, os.path.join(folder, arxiv_id)
+            ).result()
+            metrics.observe("merge_seconds", elapsed)
+            if size is None:
+                logger.debug(f"No Latex files for {arxiv_id}")
+                return None
+        return arxiv_id, filepath
+
+    def _scan(self, item):
+        arxiv_id, filepath = item
+        _id, _ = split_version(arxiv_id)
+        # PDFs cannot be contextualized, URLs might be in footnotes or appendices
+        with metrics.timer("scan_seconds"):
+            return _scan_file((_id, filepath, self._source_type == "latex"))
+
+    def run(self, query, limit=1000):
+        """Run all the stages on the search results, write the results as they come."""
+        results = ResultsWriter(self._output, resume=self._resume)
+        pub_finder = PubFinder(self._github, self._zenodo)
+        arxiv_ids = (
+            arxiv_id
+            for arxiv_id in self._downloader.search(query, limit)
+            if split_version(arxiv_id)[0] not in results.done
+        )
+
+        start = time.monotonic()
+        checked = 0
+        with ProcessPoolExecutor(self._extract_workers) as executor:
+            pipeline = (
+                Pipeline(self._queue_size)
+                .add_stage("download", self._download, self._download_workers)
+                .add_stage(
+                    "extract",
+                    lambda arxiv_id: self._extract(arxiv_id, executor),
+                    self._extract_workers
+                    if self._source_type == "latex" or self._backend.processes
+                    else self._backend.workers,
+                )
+                .add_stage("scan", self._scan)
+            )
+            for arxiv_id, found_publis in pub_finder.find_many(pipeline.run(arxiv_ids)):
+                results.write(arxiv_id, found_publis)
+                checked += 1
+                logger.info("Checked %s - %d papers", arxiv_id, checked)
+
+        pub_finder.close()
+        self._github.close()
+        self._downloader.compact_manifest()
+        results.close()
+        elapsed = time.monotonic() - start
+        logger.info(f"Checked {checked} papers in {elapsed:.1f}s, results in {self._output}")
@@ -1,8 +1,11 @@
 import logging
 import re
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from enums import Repos
+from .enums import Repos
+from .rate_limiter import HostLimiter
+from .repo_store import RepoStore
 
 logger = logging.getLogger("Pub link finder")
 
@@ -12,65 +15,165 @@ ARXIV_URL_REGEX = "arxiv.org/[^/]+/{arxiv_id}"
 class PubFinder:
     """Find publication URLs in repos."""
 
-    def __init__(self, github, zenodo):
+    # per host: max concurrent requests, max requests per second, only for the
+    # requests sent to the network, not the ones answered by the cache
+    HOSTS_LIMITS = {
+        "github": (4, 10),
+        "zenodo": (2, 2),
+    }
+
+    def __init__(self, github, zenodo, workers=8, store=None):
         self._github_apis = github
         self._zenodo_apis = zenodo
-        self._rate_limiter_sleep = 0.1  # 100 milliseconds
+        self._workers = workers
+        # repos cited by many publications are fetched only once
+        self._store = store or RepoStore()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._hosts = {
+            host: HostLimiter(host, concurrency, rate)
+            for host, (concurrency, rate) in self.HOSTS_LIMITS.items()
+        }
+        self._finders = {
+            Repos.GITHUB.value: ("github", self._github),
+            Repos.ZENODO_RECORD.value: ("zenodo", self._zenodo),
+            Repos.ZENODO_DOI.value: ("zenodo", self._zenodo),
+        }
 
-    def _github(self, publication_id, _id):
+    def _github(self, _id):
         org, repo = _id
         try:
             (
                 description,
                 readme,
                 correct_url,
-            ) = self._github_apis.get_description_readme(org, repo)
+            ) = self._github_apis.get_description_readme(
+                org, repo, self._hosts["github"].request
+            )
         except ValueError:
             # skip if not valid GitHub repo
-            return ""
+            return "", ""
 
-        return description.lower() + readme.lower(), correct_url
+        return description + readme, correct_url
 
-    def _zenodo(self, publication_id, _id):
+    def _zenodo(self, _id):
         recid_or_doi = _id
-        if zenodo_record := self._zenodo_apis.get_record(recid_or_doi):
+        if zenodo_record := self._zenodo_apis.get_record(
+            recid_or_doi, self._hosts["zenodo"].request
+        ):
             record_text, correct_url = zenodo_record
             return record_text, correct_url
         logging.error("_zenodo: Zenodo API has returned a Non-usable value")
         return "", ""
 
-    def find(self, publication_id, repo_ids):
-        """Find publication URL in repos metadata or files."""
+    def _is_found(self, publication_id, repo, _id, content, correct_url):
+        arxiv_url = ARXIV_URL_REGEX.format(arxiv_id=publication_id)
+        has_arxiv_url = re.search(arxiv_url, content, re.M | re.I)
+        # called for each repo of each paper: formatted only when enabled
+        if has_arxiv_url:
+            logger.info(
+                "ArXiV id %s found in %s: %s (%s)", publication_id, repo, _id, correct_url
+            )
+            return "Found"
+        logger.debug(
+            "ArXiV id %s not found in %s: %s (%s)", publication_id, repo, _id, correct_url
+        )
+        return "Not found"
+
+    def _fetch(self, repo, _id):
+        """Fetch the content of a repo, the clients request within the host limits."""
+        _, func = self._finders[repo]
+        content, correct_url = func(_id)
+        return content.lower(), correct_url
+
+    def _fetch_github_batch(self, ids):
+        """Fetch the content of many GitHub repos with a single batch request."""
+        fetched = self._github_apis.get_descriptions_readmes(ids, self._hosts["github"].request)
+
+        return {
+            _id: ((description + readme).lower(), correct_url)
+            for _id, (description, readme, correct_url) in fetched.items()
+        }
+
+    def _check(self, publication_id, repo, _id):
+        """Check if the publication URL is in the repo."""
+        content, correct_url = self._store.get(repo, _id, lambda _id: self._fetch(repo, _id))
+        return {_id: self._is_found(publication_id, repo, _id, content, correct_url)}
+
+    def _check_github_batch(self, publication_id, repo, ids):
+        """Check many GitHub repos at once, the missing ones fetched with a single batch request."""
+        fetched = self._store.get_many(repo, ids, self._fetch_github_batch)
+
         results = {}
+        for _id in ids:
+            content, correct_url = fetched[_id]
+            results[_id] = self._is_found(publication_id, repo, _id, content, correct_url)
+        return results
+
+    def _submit(self, publication_id, repo_ids):
+        """Submit the check of all the repos of a publication."""
+        futures = {}
         if not repo_ids:
             logging.error(f"pub_finder_find Error: no ID's given for repos: '{repo_ids}'.")
-            return results
+            return futures
         if not publication_id:
             logging.error("pub_finder_find Error: The publication ID is empty or None.")
-            return results
+            return futures
 
-        arxiv_url = ARXIV_URL_REGEX.format(arxiv_id=publication_id)
         for repo, ids in repo_ids.items():
-            if repo == Repos.GITHUB.value:
-                func = self._github
-            elif repo == Repos.ZENODO_RECORD.value:
-                func = self._zenodo
-            elif repo == Repos.ZENODO_DOI.value:
-                func = self._zenodo
-            else:
+            if repo not in self._finders:
                 logger.error(f"Finder for {repo} not implemented.")
                 continue
 
-            results.setdefault(repo, {})
+            futures[repo] = []
+            if repo == Repos.GITHUB.value and len(ids) > 1:
+                futures[repo].append(
+                    self._executor.submit(
+                        self._check_github_batch, publication_id, repo, ids
+                    )
+                )
+                continue
             for _id in ids:
-                content, correct_url = func(publication_id, _id)
-                has_arxiv_url = re.search(arxiv_url, content.lower(), re.M | re.I)
-                if has_arxiv_url:
-                    results[repo][_id] = "Found"
-                    logger.info(f"ArXiV id {publication_id} found in {repo}: {_id} ({correct_url})")
-                else:
-                    results[repo][_id] = "Not found"
-                    logger.debug(f"ArXiV id {publication_id} not found in {repo}: {_id} ({correct_url})")
-                time.sleep(self._rate_limiter_sleep)
+                futures[repo].append(
+                    self._executor.submit(self._check, publication_id, repo, _id)
+                )
+        return futures
 
+    def _collect(self, futures):
+        """Wait for the checks of a publication, return the results."""
+        results = {}
+        for repo, repo_futures in futures.items():
+            results[repo] = {}
+            for future in repo_futures:
+                results[repo].update(future.result())
         return results
+
+    def find(self, publication_id, repo_ids):
+        """Find publication URL in repos metadata or files.
+
+        All the repos are checked concurrently, GitHub repos in a single batch.
+        """
+        return self._collect(self._submit(publication_id, repo_ids))
+
+    def find_many(self, publications):
+        """Find publication URLs for many publications, concurrently.
+
+        `publications` is an iterable of `(publication_id, repo_ids)`. Yield
+        `(publication_id, results)` in the same order, while checking the
+        repos of the following publications in the background.
+        """
+        in_flight = deque()
+        for publication_id, repo_ids in publications:
+            in_flight.append((publication_id, self._submit(publication_id, repo_ids)))
+            if len(in_flight) > self._workers * 2:
+                publication_id, futures = in_flight.popleft()
+                yield publication_id, self._collect(futures)
+
+        while in_flight:
+            publication_id, futures = in_flight.popleft()
+            yield publication_id, self._collect(futures)
+
+    def close(self):
+        self._executor.shutdown()
+        logger.info(
+            f"Fetched {self._store.fetched} distinct repos, {self._store.hits} reused"
+        )
@@ -0,0 +1,56 @@
+import contextlib
+import threading
+import time
+
+from .metrics import metrics
+
+
+class RateLimiter:
+    """Token bucket rate limiter, safe to share between threads."""
+
+    def __init__(self, name, rate, burst=1):
+        """Allow `rate` requests per second, with bursts of up to `burst`.
+
+        `name` labels the time spent waiting in the metrics.
+        """
+        self._rate = rate
+        self._name = name
+        self._capacity = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available. Return the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._last
+                self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+            waited += wait
+
+        if waited:
+            metrics.observe("rate_limit_sleep_seconds", waited, limiter=self._name)
+        return waited
+
+
+class HostLimiter:
+    """Limits of the requests to a host: `concurrency` at once, `rate` per second."""
+
+    def __init__(self, name, concurrency, rate):
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._rate_limiter = RateLimiter(name, rate, concurrency)
+
+    @contextlib.contextmanager
+    def request(self):
+        """Hold a slot of the host, once allowed by its rate, for a network request."""
+        with self._semaphore:
+            self._rate_limiter.acquire()
+            yield
@@ -0,0 +1,251 @@
+"""Record the responses of the APIs to a fixture archive, and replay them offline."""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger("Replay")
+
+# the API hosts, other requests (ArXiV, Tika servers) always go to the network
+API_HOSTS = ("api.github.com", "zenodo.org", "doi.org")
+GRAPHQL_URL_REGEX = r"^https://api\.github\.com(?::443)?/graphql$"
+# secrets, and encodings of the content which is recorded decoded; request
+# headers, with the tokens, are never recorded at all
+DROPPED_HEADERS = (
+    "authorization",
+    "set-cookie",
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+)
+
+
+class ReplayArchive:
+    """Gzipped JSON lines archive of HTTP responses, by request.
+
+    As a context manager, all the requests to `hosts` sent with `requests`
+    (PyGithub included) go through the archive: in `record` mode they are
+    sent to the network and their responses recorded, written on exit.
+    Otherwise they are replayed from the archive, after `latency` seconds,
+    and a request not recorded gets a 404.
+
+    `rate_limits` simulates the rate limits of each host, as `{host:
+    (requests, seconds)}`: beyond them, requests get a rate limit error as
+    the real APIs would send.
+
+    GitHub GraphQL batch queries are recorded per repo, so that they are
+    replayed whatever the repos batched together, which depends on timing.
+    """
+
+    def __init__(self, filepath, record=False, latency=0, rate_limits=None, hosts=API_HOSTS):
+        self._filepath = filepath
+        self._record = record
+        self._latency = latency
+        self._rate_limits = rate_limits or {}
+        self._hosts = hosts
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._entries = self._load() if os.path.exists(filepath) else {}
+        self._send = None
+        self.requests = 0
+        self.missed = 0
+        self.limited = 0
+
+    def _load(self):
+        entries = {}
+        with gzip.open(self._filepath, "rt", encoding="utf-8") as fp:
+            for line in fp:
+                entry = json.loads(line)
+                entries[entry["key"]] = entry
+        logger.info(f"Loaded {len(entries)} recorded responses from {self._filepath}")
+        return entries
+
+    def save(self):
+        """Write the archive atomically, sorted so that recordings diff well."""
+        os.makedirs(os.path.dirname(self._filepath) or ".", exist_ok=True)
+        tmp_filepath = f"{self._filepath}.part"
+        with gzip.open(tmp_filepath, "wt", encoding="utf-8") as fp:
+            for key in sorted(self._entries):
+                fp.write(json.dumps(self._entries[key]) + "\n")
+        os.replace(tmp_filepath, self._filepath)
+        logger.info(f"Recorded {len(self._entries)} responses in {self._filepath}")
+
+    def __enter__(self):
+        archive = self
+        self._send = send = HTTPAdapter.send
+
+        def _send(adapter, request, **kwargs):
+            if urlparse(request.url).hostname not in archive._hosts:
+                return send(adapter, request, **kwargs)
+            if archive._record:
+                return archive._record_send(send, adapter, request, **kwargs)
+            return archive._replay(request)
+
+        HTTPAdapter.send = _send
+        return self
+
+    def __exit__(self, *exc_info):
+        HTTPAdapter.send = self._send
+        if self._record:
+            self.save()
+
+    def _key(self, request):
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key = f"{request.method} {request.url}"
+        if body:
+            key += f" {hashlib.sha256(body).hexdigest()[:16]}"
+        return key
+
+    def _graphql_repos(self, request):
+        """Return the alias of each repo of a GraphQL batch query, with its key."""
+        variables = json.loads(request.body)["variables"]
+        repos = {}
+        for name, org in variables.items():
+            if not (match := re.fullmatch(r"o(\d+)", name)):
+                continue
+            i = match[1]
+            files = [
+                variables[f"e{i}_{j}"] for j in range(len(variables)) if f"e{i}_{j}" in variables
+            ]
+            key = f"GRAPHQL {org}/{variables[f'n{i}']}".lower()
+            if files:
+                key += f" {','.join(files)}"
+            repos[f"r{i}"] = key
+        return repos
+
+    def _entry(self, key, status_code, headers, content):
+        headers = {
+            name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS
+        }
+        try:
+            return {
+                "key": key,
+                "status_code": status_code,
+                "headers": headers,
+                "text": content.decode("utf-8"),
+            }
+        except UnicodeDecodeError:
+            return {
+                "key": key,
+                "status_code": status_code,
+                "headers": headers,
+                "base64": base64.b64encode(content).decode("ascii"),
+            }
+
+    def _record_send(self, send, adapter, request, **kwargs):
+        response = send(adapter, request, **kwargs)
+        content = response.content
+        with self._lock:
+            self.requests += 1
+            if re.match(GRAPHQL_URL_REGEX, request.url) and response.status_code == 200:
+                data = response.json().get("data") or {}
+                for alias, key in self._graphql_repos(request).items():
+                    repo = json.dumps(data.get(alias)).encode("utf-8")
+                    self._entries[key] = self._entry(key, 200, {}, repo)
+            else:
+                key = self._key(request)
+                self._entries[key] = self._entry(
+                    key, response.status_code, response.headers, content
+                )
+        return response
+
+    def _rate_limited(self, host):
+        """Count the request in the current window of the host.
+
+        Return if it is over the limit, and the rate limit headers to send.
+        """
+        if host not in self._rate_limits:
+            return None, None
+        limit, seconds = self._rate_limits[host]
+        now = time.time()
+        with self._lock:
+            start, count = self._windows.get(host, (now, 0))
+            if now - start >= seconds:
+                start, count = now, 0
+            count += 1
+            self._windows[host] = (start, count)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(max(limit - count, 0)),
+            "X-RateLimit-Reset": str(int(start + seconds) + 1),
+        }
+        return count > limit, headers
+
+    def _response(self, request, status_code, headers, content):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.reason = HTTPStatus(status_code).phrase
+        return response
+
+    def _replay(self, request):
+        host = urlparse(request.url).hostname
+        if self._latency:
+            time.sleep(self._latency)
+
+        limited, limit_headers = self._rate_limited(host)
+        with self._lock:
+            self.requests += 1
+            if limited:
+                self.limited += 1
+        if limited:
+            retry_after = int(limit_headers["X-RateLimit-Reset"]) - int(time.time())
+            headers = {**limit_headers, "Retry-After": str(max(retry_after, 1))}
+            if host == "api.github.com":
+                # as GitHub: a 403, with a message PyGithub recognizes
+                content = b'{"message": "API rate limit exceeded (simulated)"}'
+                return self._response(request, 403, headers, content)
+            return self._response(request, 429, headers, b"Too many requests (simulated)")
+
+        if re.match(GRAPHQL_URL_REGEX, request.url):
+            entry, content = self._replay_graphql(request)
+        else:
+            entry = self._entries.get(self._key(request))
+            content = None
+        if entry is None:
+            with self._lock:
+                self.missed += 1
+            logger.warning(f"Not recorded: {request.method} {request.url}")
+            return self._response(request, 404, {}, b'{"message": "Not Found"}')
+
+        if content is None:
+            if "text" in entry:
+                content = entry["text"].encode("utf-8")
+            else:
+                content = base64.b64decode(entry["base64"])
+        headers = {**entry["headers"], **(limit_headers or {})}
+        return self._response(request, entry["status_code"], headers, content)
+
+    def _replay_graphql(self, request):
+        """Rebuild the response of a batch query from the repos recorded."""
+        data = {}
+        for alias, key in self._graphql_repos(request).items():
+            if entry := self._entries.get(key):
+                data[alias] = json.loads(entry["text"])
+            else:
+                data[alias] = None
+                with self._lock:
+                    self.missed += 1
+                logger.warning(f"Not recorded: {key}")
+        entry = {"status_code": 200, "headers": {"Content-Type": "application/json"}}
+        return entry, json.dumps({"data": data}).encode("utf-8")
@@ -0,0 +1,86 @@
+"""Store of the repos contents fetched during a run."""
+
+import logging
+import threading
+from concurrent.futures import Future
+
+from .enums import Repos
+
+logger = logging.getLogger("Repo store")
+
+
+class RepoStore:
+    """In-memory store of the repos contents, each repo is fetched only once.
+
+    Repos are keyed by a normalized identity, so that the same repo cited
+    by many papers, or with different cases, is fetched a single time.
+    Concurrent requests of a repo being fetched wait for the same result.
+    Failed fetches are not stored, and retried on the next request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+        self.fetched = 0
+        self.hits = 0
+
+    def key(self, repo, _id):
+        """Normalized identity of a repo."""
+        if repo == Repos.GITHUB.value:
+            org_name, repo_name = _id
+            repo_name = repo_name.lower()
+            if repo_name.endswith(".git"):
+                repo_name = repo_name[: -len(".git")]
+            return repo, org_name.lower(), repo_name
+        if repo == Repos.ZENODO_DOI.value:
+            return repo, _id.lower().replace("http://", "https://", 1)
+        return repo, str(_id)
+
+    def _reserve(self, repo, ids):
+        """Return the futures of the given ids, and the ids to fetch by the caller."""
+        futures = {}
+        to_fetch = []
+        with self._lock:
+            for _id in ids:
+                key = self.key(repo, _id)
+                if key in self._futures:
+                    self.hits += 1
+                else:
+                    self._futures[key] = Future()
+                    to_fetch.append(_id)
+                futures[_id] = self._futures[key]
+        return futures, to_fetch
+
+    def _release(self, repo, futures, ids, results=None, exception=None):
+        for _id in ids:
+            future = futures[_id]
+            if exception is not None:
+                with self._lock:
+                    self._futures.pop(self.key(repo, _id), None)
+                future.set_exception(exception)
+            else:
+                future.set_result(results[_id])
+
+    def get(self, repo, _id, fetch):
+        """Return the `(content, correct_url)` of a repo, fetched with `fetch(_id)` if needed."""
+        return self.get_many(repo, [_id], lambda ids: {ids[0]: fetch(ids[0])})[_id]
+
+    def get_many(self, repo, ids, fetch_many):
+        """Return `{_id: (content, correct_url)}` of many repos.
+
+        The repos not in the store are fetched at once with `fetch_many(ids)`,
+        returning the same mapping.
+        """
+        futures, to_fetch = self._reserve(repo, ids)
+        if to_fetch:
+            try:
+                fetched = fetch_many(to_fetch)
+                results = {_id: fetched[_id] for _id in to_fetch}
+            except BaseException as e:
+                self._release(repo, futures, to_fetch, exception=e)
+                raise
+            with self._lock:
+                self.fetched += len(to_fetch)
+            self._release(repo, futures, to_fetch, results=results)
+
+        return {_id: future.result() for _id, future in futures.items()}
@@ -1,9 +1,11 @@
 """Find URLs in a given text."""
 
+import bisect
 import logging
 import re
+import string
 
-from enums import Repos
+from .enums import Repos
 
 logger = logging.getLogger("URLs finder")
 
@@ -22,17 +24,29 @@ KEYWORDS = [
 URLS_REGEX = [
     (
         Repos.GITHUB.value,
-        "https?://(?:www\.)?github\.com/([a-zA-Z0-9_.-]+)/([a-zA-Z0-9_.-]+)",
+        r"https?://(?:www\.)?github\.com/([a-zA-Z0-9_.-]+)/([a-zA-Z0-9_.-]+)",
     ),
-    (Repos.ZENODO_RECORD.value, "https?://zenodo\.org/records?/(\d+)"),
-    (Repos.ZENODO_DOI.value, "(https?://doi\.org/10\.5281/zenodo\.\d+)"),
+    (Repos.ZENODO_RECORD.value, r"https?://zenodo\.org/records?/(\d+)"),
+    (Repos.ZENODO_DOI.value, r"(https?://doi\.org/10\.5281/zenodo\.\d+)"),
     # ADD MORE
 ]
 KEYWORDS_REGEX = r"\b(?:{KEYWORDS})\b"
-MAX_DISTANCE_BEFORE_REGEX = r"(?:\s+\S+){{0,{N_WORDS}}}"
-URL_MATCH_BEFORE_REGEX = r"{keywords}{max_distance}(?:\s+|){url}"
-MAX_DISTANCE_AFTER_REGEX = r"(?:\S+\s+){{0,{N_WORDS}}}"
-URL_MATCH_AFTER_REGEX = r"{url}(?:\s+|){max_distance}{keywords}"
+WORDS_REGEX = r"\S+"
+
+
+# Literal host required by each URL regex: URLs are only matched around the
+# occurrences of the host, much faster than scanning all the text with each regex.
+URLS_HOSTS = {
+    Repos.GITHUB.value: "github.com/",
+    Repos.ZENODO_RECORD.value: "zenodo.org/",
+    Repos.ZENODO_DOI.value: "doi.org/",
+}
+URL_HOST_MAX_OFFSET = len("https://www.")  # max distance of the host from the URL start
+ASCII_LOWERCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+URLS_PATTERNS = [(repo, re.compile(url_regex, re.M | re.I)) for repo, url_regex in URLS_REGEX]
+KEYWORDS_PATTERN = re.compile(KEYWORDS_REGEX.format(KEYWORDS="|".join(KEYWORDS)), re.M | re.I)
+WORDS_PATTERN = re.compile(WORDS_REGEX)
 
 
 class ReposFinder:
@@ -60,60 +74,155 @@ class ReposFinder:
         return repo_name if modified else None
 
     def _clean_urls(self, urls: list) -> list:
-        clean_urls = set()
+        # dict keeps the order in which URLs appear in the text
+        clean_urls = dict()
         for _tuple in urls:
             non_empty = self._clean_empty_tuples(_tuple)
             # GitHub, as of 2023, allows URLs to end with a "."
-            clean_urls.add(non_empty)  # To avoid wrongful removal of "." adding unmodified url initially.
+            clean_urls[non_empty] = None  # To avoid wrongful removal of "." adding unmodified url initially.
             if isinstance(non_empty, tuple):
                 if cleaned := self._clean_repo_name(non_empty[1]):
-                    clean_urls.add((non_empty[0], cleaned))
+                    clean_urls[(non_empty[0], cleaned)] = None
             elif isinstance(non_empty, str):
                 if cleaned := self._clean_repo_name(non_empty):
-                    clean_urls.add(cleaned)
+                    clean_urls[cleaned] = None
             else:
                 logging.warning(f"_clean_urls: The following url has not been considered: {non_empty}, {type(non_empty)}")
                 continue
         return list(clean_urls)
 
+    def _is_contextualized(self, words, keywords_before, keywords_after, keywords_glued, url):
+        """Check if a keyword is at most N words before or after the URL.
+
+        Words are counted as with the original regexes: a URL in the middle of
+        a word, e.g. in a Latex command, also counts the beginning of the word.
+        """
+        starts, ends = words
+        max_words = self._contextualized_words
+        # keyword immediately before or after the URL
+        keywords_ends, keywords_starts = keywords_glued
+        if url.start() in keywords_ends or url.end() in keywords_starts:
+            return True
+
+        i_url_start = bisect.bisect_right(starts, url.start()) - 1
+        in_word = url.start() > starts[i_url_start]
+        i_min = i_url_start - 1 - (max_words - in_word)
+        i = bisect.bisect_left(keywords_before, i_min)
+        if i < len(keywords_before) and keywords_before[i] < i_url_start:
+            return True
+
+        i_url_end = bisect.bisect_right(starts, url.end() - 1) - 1
+        in_word = url.end() < ends[i_url_end]
+        i_max = i_url_end + 1 + (max_words - in_word)
+        i = bisect.bisect_right(keywords_after, i_url_end)
+        return i < len(keywords_after) and keywords_after[i] <= i_max
+
     def _find_contextualized(self, publication_id, text):
+        """Find URLs with a keyword at most N words before or after.
+
+        Words, keywords and URLs are found once, then their distance is
+        checked with an index of the words positions, in linear time.
+        """
+        text = self._unescape_latex(text)
+        starts, ends = [], []
+        for word in WORDS_PATTERN.finditer(text):
+            starts.append(word.start())
+            ends.append(word.end())
+
+        # index of the words of keywords that can be followed or preceded by
+        # other words, i.e. at the end or the beginning of the word
+        keywords_before, keywords_after = [], []
+        keywords_ends, keywords_starts = set(), set()
+        for keyword in KEYWORDS_PATTERN.finditer(text):
+            i = bisect.bisect_right(starts, keyword.start()) - 1
+            if keyword.end() == ends[i]:
+                keywords_before.append(i)
+            if keyword.start() == starts[i]:
+                keywords_after.append(i)
+            keywords_ends.add(keyword.end())
+            keywords_starts.add(keyword.start())
+
+        found = {repo: [] for repo, _ in URLS_REGEX}
+        # as with the original regexes, URLs glued together are all candidates
+        for repo, match, url in self._scan_urls(text, overlapping=True):
+            if self._is_contextualized(
+                (starts, ends),
+                keywords_before,
+                keywords_after,
+                (keywords_ends, keywords_starts),
+                match,
+            ):
+                found[repo].append(url)
+
         results = dict()
-        for repo, url_regex in URLS_REGEX:
-            results.setdefault(repo, [])
-            for max_distance_regex, url_match_regex in [(MAX_DISTANCE_BEFORE_REGEX, URL_MATCH_BEFORE_REGEX), (MAX_DISTANCE_AFTER_REGEX, URL_MATCH_AFTER_REGEX)]:
-                regex = url_match_regex.format(
-                    max_distance=max_distance_regex.format(N_WORDS=self._contextualized_words),
-                    keywords=KEYWORDS_REGEX.format(KEYWORDS="|".join(KEYWORDS)),
-                    url=url_regex,
-                )
-                text = text.replace("\-", "-").replace("\_", "_")  # Avoids url non recognition due to latex notation
-                urls = re.findall(regex, text, re.M | re.I)
-                if urls:
-                    no_empty_urls = self._clean_urls(urls)   # keep only non-empty and clean up wrongly extracted urls
-                    _urls = [str(t) for t in no_empty_urls]  # convert tuples to string
-                    logger.debug(
-                        f"{publication_id} | {repo}: found URLs `{', '.join(_urls)}`"
-                    )
-                    results[repo] += no_empty_urls
-            if not results[repo]:
-                logger.debug(f"{publication_id} | {repo}: no URLs found")
+        for repo, urls in found.items():
+            results[repo] = self._clean_urls(urls)  # keep only non-empty and clean up wrongly extracted urls
+        self._log_urls(publication_id, results)
         return results
 
-    def _find_all(self, publication_id, text):
-        results = dict()
-        for repo, url_regex in URLS_REGEX:
-            text = text.replace("\-", "-").replace("\_", "_") # Avoids url non recognition due to latex notation
-            urls = re.findall(url_regex, text, re.M | re.I)
+    def _log_urls(self, publication_id, results):
+        # called for each paper: nothing is formatted when debug logs are disabled
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        for repo, urls in results.items():
             if urls:
-                clean_urls = self._clean_urls(urls)   # keep only non-empty and clean up wrongly extracted urls
-                _urls = [str(t) for t in clean_urls]  # convert tuples to string
-                logger.debug(
-                    f"{publication_id} | {repo}: found URLs `{', '.join(_urls)}`"
-                )
-                results[repo] = clean_urls
+                _urls = [str(t) for t in urls]  # convert tuples to string
+                logger.debug("%s | %s: found URLs `%s`", publication_id, repo, ", ".join(_urls))
             else:
-                logger.debug(f"{publication_id} | {repo}: no URLs found")
-                results[repo] = []
+                logger.debug("%s | %s: no URLs found", publication_id, repo)
+
+    def _unescape_latex(self, text):
+        # Avoids url non recognition due to latex notation
+        return text.replace("\\-", "-").replace("\\_", "_")
+
+    def _finditer(self, pattern, text, lowered, host, overlapping=False):
+        """Same as `pattern.finditer(text)`, only trying to match near the host.
+
+        When `overlapping`, also find URLs starting inside the previous one.
+        """
+        if not host:
+            yield from pattern.finditer(text)
+            return
+
+        last_end = 0
+        hit = lowered.find(host)
+        while hit != -1:
+            for start in range(max(last_end, hit - URL_HOST_MAX_OFFSET), hit + 1):
+                if match := pattern.match(text, start):
+                    last_end = start + 1 if overlapping else match.end()
+                    yield match
+                    break
+            hit = lowered.find(host, hit + 1)
+
+    def _scan_urls(self, text, overlapping=False):
+        """Yield `(repo, match, url)` for all URLs in the text.
+
+        `url` is the value of the regex groups, as returned by `re.findall`.
+        """
+        # ASCII only, to keep the same positions as in the text
+        lowered = text.translate(ASCII_LOWERCASE)
+        for repo, pattern in URLS_PATTERNS:
+            host = URLS_HOSTS.get(repo)
+            for match in self._finditer(pattern, text, lowered, host, overlapping):
+                groups = tuple(group or "" for group in match.groups())
+                if not groups:
+                    url = match.group(0)
+                elif len(groups) == 1:
+                    url = groups[0]
+                else:
+                    url = groups
+                yield repo, match, url
+
+    def _find_all(self, publication_id, text):
+        found = {repo: [] for repo, _ in URLS_REGEX}
+        for repo, _, url in self._scan_urls(self._unescape_latex(text)):
+            found[repo].append(url)
+
+        results = dict()
+        for repo, urls in found.items():
+            # keep only non-empty and clean up wrongly extracted urls
+            results[repo] = self._clean_urls(urls) if urls else []
+        self._log_urls(publication_id, results)
         return results
 
     def find(self, publication_id, text, contextualized=False):
@@ -0,0 +1,69 @@
+"""Results of the bidirectional links check, written as they are found."""
+
+import csv
+import io
+import logging
+import os
+import threading
+
+logger = logging.getLogger("Results")
+
+HEADER = ["ArXiV id", "Result", "Where"]
+
+
+class ResultsWriter:
+    """Append-only CSV of the results, one or more rows per publication.
+
+    The rows of a publication are written and flushed as soon as it is
+    checked, with one row per found repo, or a single `Not found` row.
+    When the file already exists, the publications it contains are loaded
+    so that an interrupted run can be resumed, skipping them.
+    """
+
+    def __init__(self, filepath, resume=True):
+        self._filepath = filepath
+        self._lock = threading.Lock()
+        self.done = set()
+
+        if resume and os.path.exists(filepath):
+            self._load()
+            self._fp = open(filepath, "a", newline="")
+        else:
+            self._fp = open(filepath, "w", newline="")
+            csv.writer(self._fp).writerow(HEADER)
+            self._fp.flush()
+
+    def _load(self):
+        with open(self._filepath, "rb+") as fp:
+            content = fp.read()
+            # drop the truncated last line of an interrupted run
+            if content and not content.endswith(b"\n"):
+                content = content[: content.rfind(b"\n") + 1]
+                fp.truncate(len(content))
+
+        reader = csv.reader(io.StringIO(content.decode("utf-8")))
+        next(reader, None)  # header
+        self.done = {row[0] for row in reader if row}
+        logger.info(f"Resuming {self._filepath}, {len(self.done)} publications already checked")
+
+    def write(self, arxiv_id, results):
+        """Write the results of a publication, as returned by `PubFinder`."""
+        rows = [
+            [arxiv_id, "Found", f"Repo: {repo} - {str(_id)}"]
+            for repo, ids in results.items()
+            for _id, value in ids.items()
+            if value == "Found"
+        ]
+        if not rows:
+            rows = [[arxiv_id, "Not found", ""]]
+
+        # a single write, so that a publication is never partially recorded
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        with self._lock:
+            self._fp.write(buffer.getvalue())
+            self._fp.flush()
+            self.done.add(arxiv_id)
+
+    def close(self):
+        self._fp.close()
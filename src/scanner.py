@@ -0,0 +1,42 @@
+"""Scan text files for repos URLs, in parallel processes."""
+
+import logging
+import multiprocessing
+from functools import partial
+
+from .metrics import metrics, timed
+from .repos_finder import ReposFinder
+
+logger = logging.getLogger("Scanner")
+
+
+def _scan_file(args):
+    arxiv_id, filepath, contextualized = args
+    with open(filepath, errors="replace") as fp:
+        text = fp.read()
+    return arxiv_id, ReposFinder().find(arxiv_id, text, contextualized=contextualized)
+
+
+def _timed(scanned):
+    for result, elapsed in scanned:
+        metrics.observe("scan_seconds", elapsed)
+        yield result
+
+
+def scan_files(files, contextualized=False, workers=None):
+    """Find the repos URLs in many text files, across a pool of processes.
+
+    `files` is an iterable of `(arxiv_id, filepath)`. Yield `(arxiv_id, repos_ids)`
+    as soon as each file is scanned, so that the caller can start working on
+    the results while the other files are still scanned. With `workers=1`,
+    files are scanned in the current process.
+    """
+    tasks = ((arxiv_id, filepath, contextualized) for arxiv_id, filepath in files)
+    # timed in the processes, recorded here
+    scan_file = partial(timed, _scan_file)
+    if workers == 1:
+        yield from _timed(map(scan_file, tasks))
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from _timed(pool.imap_unordered(scan_file, tasks, chunksize=4))
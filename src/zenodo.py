@@ -1,29 +1,41 @@
+import contextlib
 import logging
 import re
 
 import requests
 
 from .doi import get_redirect_url
+from .metrics import metrics
 from .utils import is_valid_url
 
 logger = logging.getLogger("ZenodoAPI")
 
 
 class ZenodoAPI:
-    def __init__(self):
+    def __init__(self, cache=None):
         self.base_url = "https://zenodo.org/api/records"
+        self._cache = cache
 
-    def _get_record(self, recid):
+    def _get_record(self, recid, throttle):
         url = f"{self.base_url}/{recid}"
-        logger.debug(f"Final URL: `{url}`")
-        return requests.get(url).text, url
-
-    def get_record(self, recid_or_doi):
-        logger.debug(f"Fetching Zenodo record metadata for `{recid_or_doi}`")
+        logger.debug("Final URL: `%s`", url)
+        try:
+            if self._cache:
+                return self._cache.get(url, api="zenodo", throttle=throttle).text, url
+            metrics.inc("api_calls_total", api="zenodo")
+            with throttle():
+                return requests.get(url).text, url
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Cannot fetch Zenodo record `{recid}`: {e}. Skipping...")
+            return None
+
+    def get_record(self, recid_or_doi, throttle=contextlib.nullcontext):
+        """Return the record text and URL, the Zenodo requests sent within `throttle()`."""
+        logger.debug("Fetching Zenodo record metadata for `%s`", recid_or_doi)
         is_doi = "doi.org" in recid_or_doi
         if is_doi:
             try:
-                record_url = get_redirect_url(recid_or_doi)
+                record_url = get_redirect_url(recid_or_doi, self._cache)
                 match = re.search(r"[0-9]+", record_url)
                 # fail if no match, it should not happen
                 recid = match.group(0)
@@ -33,4 +45,4 @@ class ZenodoAPI:
         else:
             recid = recid_or_doi
 
-        return self._get_record(recid)
+        return self._get_record(recid, throttle)
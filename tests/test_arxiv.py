@@ -0,0 +1,78 @@
+import gzip
+import io
+import os
+import tarfile
+
+from src.arxiv import ArXiVDownloader
+from src.manifest import DownloadManifest
+
+
+def _tar_gz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def test_extract_stream_tar(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = ArXiVDownloader()
+    eprint = _tar_gz(
+        {
+            "main.tex": b"\\input{sections/intro}",
+            "sections/intro.tex": b"intro",
+            "main.bbl": b"\\bibitem{a}",
+            "figure.png": b"png",
+            "../evil.tex": b"evil",
+        }
+    )
+    folder_path = downloader._extract_stream(io.BytesIO(eprint), "1234v1")
+
+    extracted = sorted(
+        os.path.relpath(os.path.join(root, f), folder_path)
+        for root, _, files in os.walk(folder_path)
+        for f in files
+    )
+    assert extracted == ["main.bbl", "main.tex", os.path.join("sections", "intro.tex")]
+    assert not os.path.exists(tmp_path / "sources" / "evil.tex")
+    assert not os.path.exists(tmp_path / "sources" / "1234v1.part")
+
+
+def test_extract_stream_single_tex(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = ArXiVDownloader()
+    eprint = gzip.compress(b"\\documentclass{article} single file")
+    folder_path = downloader._extract_stream(io.BytesIO(eprint), "1234v1")
+
+    with open(os.path.join(folder_path, "1234v1.tex"), "rb") as f:
+        assert f.read() == b"\\documentclass{article} single file"
+
+
+def test_extract_stream_pdf_only(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = ArXiVDownloader()
+    folder_path = downloader._extract_stream(io.BytesIO(b"%PDF-1.5 ..."), "1234v1")
+
+    assert os.listdir(folder_path) == []
+
+
+def test_manifest_compacted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = ArXiVDownloader()
+    monkeypatch.setattr(downloader, "_search", lambda query, limit: ["1234.0001v1", "1234.0002v1"])
+
+    def download_pdf(arxiv_id):
+        downloader._manifest.update(arxiv_id, "pdf", DownloadManifest.PARTIAL, 10)
+        downloader._manifest.update(arxiv_id, "pdf", DownloadManifest.DONE, 20)
+        return True
+
+    monkeypatch.setattr(downloader, "_download_pdf", download_pdf)
+    downloader.download_pdfs("query", 2)
+
+    with open(downloader.MANIFEST_FILE) as fp:
+        lines = fp.readlines()
+    assert len(lines) == 2
+    assert DownloadManifest(downloader.MANIFEST_FILE).is_done("1234.0001v1", "pdf")
@@ -0,0 +1,52 @@
+from src.latex.bibliography import BibliographyIndex
+
+
+def test_index_bbl(tmp_path):
+    bbl_filepath = tmp_path / "main.bbl"
+    bbl_filepath.write_text(
+        "\\begin{thebibliography}{3}\n"
+        "\\bibitem[Doe(2020)]{doe} Doe. \\href{https://zenodo.org/record/1}{Dataset}.\n"
+        "\\bibitem{none} No URL.\n"
+        "\\bibitem{last} Last. \\url{https://github.com/org/repo}\n"
+        "\\end{thebibliography}\n"
+    )
+    index = BibliographyIndex()
+    assert index.index_file(bbl_filepath) == {
+        "doe": ["https://zenodo.org/record/1"],
+        "last": ["https://github.com/org/repo"],
+    }
+
+
+def test_index_bib_and_biblatex(tmp_path):
+    bib_filepath = tmp_path / "refs.bib"
+    bib_filepath.write_text(
+        "@misc{tool,\n"
+        "  title = {Tool},\n"
+        "  url = {https://github.com/org/tool},\n"
+        "  howpublished = {\\url{https://github.com/org/tool}},\n"
+        "}\n"
+        "@article{paper, title = {Paper}}\n"
+    )
+    bbl_filepath = tmp_path / "main.bbl"
+    bbl_filepath.write_text(
+        "\\entry{data}{online}{}\n"
+        "  \\verb{url}\n"
+        "  \\verb https://zenodo.org/record/2\n"
+        "  \\endverb\n"
+        "\\endentry\n"
+    )
+    index = BibliographyIndex()
+    assert index.index_files([bib_filepath, bbl_filepath]) == {
+        "tool": ["https://github.com/org/tool"],
+        "data": ["https://zenodo.org/record/2"],
+    }
+
+
+def test_substitute_cites():
+    index = BibliographyIndex()
+    urls = {"a": ["https://github.com/org/a"], "b": ["https://github.com/org/b"]}
+    text = "See \\cite{a, b}, \\citep[p.~1]{a,c} and \\cite{c}."
+    assert index.substitute_cites(text, urls) == (
+        "See https://github.com/org/a https://github.com/org/b, "
+        "https://github.com/org/a \\cite{c} and \\cite{c}."
+    )
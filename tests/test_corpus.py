@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from src.corpus import CorpusStore
+from src.enums import Repos
+from src.latex.latex_merger import LatexMerger
+
+
+def test_stages(tmp_path):
+    corpus = CorpusStore(tmp_path / "corpus.sqlite")
+    corpus.add("1234.0001v1", "pdf")
+    corpus.add("1234.0002v1", "pdf")
+    corpus.set_text("1234.0001v1", "pdf", "text " * 1000)
+    # not downgraded
+    corpus.add("1234.0001v1", "pdf")
+
+    assert corpus.pending("pdf", CorpusStore.DOWNLOADED) == ["1234.0002v1"]
+    assert corpus.pending("pdf", CorpusStore.EXTRACTED) == ["1234.0001v1"]
+    assert corpus.get_text("1234.0001v1", "pdf") == "text " * 1000
+
+    results = {Repos.GITHUB.value: {("org", "repo"): "Found"}, Repos.ZENODO_RECORD.value: {}}
+    corpus.set_results("1234.0001v1", "pdf", results)
+    assert corpus.get_stage("1234.0001v1", "pdf") == CorpusStore.CHECKED
+    assert corpus.get_results("1234.0001v1", "pdf") == {
+        Repos.GITHUB.value: {("org", "repo"): "Found"}
+    }
+
+    assert corpus.reset("pdf", CorpusStore.DOWNLOADED) == ["1234.0001v1"]
+    assert corpus.get_text("1234.0001v1", "pdf") is None
+    assert corpus.get_results("1234.0001v1", "pdf") == {}
+    corpus.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merge_and_clean(tmp_path, workers):
+    corpus = CorpusStore(tmp_path / "corpus.sqlite")
+    for arxiv_id in ["1234.0001v1", "1234.0002v1"]:
+        os.makedirs(tmp_path / "sources" / arxiv_id)
+        (tmp_path / "sources" / arxiv_id / "main.tex").write_text(f"\\documentclass{{}} {arxiv_id}")
+    corpus.add("1234.0001v1", "latex")
+
+    merger = LatexMerger(tmp_path / "sources", workers=workers, corpus=corpus)
+    merger.run()
+    # only the papers in the corpus
+    assert os.path.exists(tmp_path / "sources" / "1234.0001v1" / "merged.tex")
+    assert not os.path.exists(tmp_path / "sources" / "1234.0002v1" / "merged.tex")
+    assert "1234.0001v1" in corpus.get_text("1234.0001v1", "latex")
+
+    merger.clean()
+    assert not os.path.exists(tmp_path / "sources" / "1234.0001v1" / "merged.tex")
+    assert corpus.pending("latex", CorpusStore.DOWNLOADED) == ["1234.0001v1"]
+    corpus.close()
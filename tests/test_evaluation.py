@@ -0,0 +1,95 @@
+import os
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.errors import EvaluationFixturesNotFound
+from src.evaluation import Evaluator, load_gold, score, url_key
+from src.replay import ReplayArchive
+
+REFERENCE_HEADER = (
+    "ArXiV id,Contains GitHub URL,GitHub URL,GitHub repo contains ArXiV URL,"
+    "Contains Zenodo URL,Zenodo URL,Zenodo record contains ArXiV URL\n"
+)
+
+
+def test_url_keys_and_score(tmp_path):
+    gold = tmp_path / "gold.csv"
+    gold.write_text(
+        "2401.00001v1.pdf,https://github.com/Org/Repo/tree/v1.0.1\n"
+        "2401.00002v2.pdf,https://doi.org/10.5281/zenodo.42\n"
+        "2401.00003v1.pdf,none\n"
+    )
+    expected = load_gold(gold)
+    assert expected == {
+        "2401.00001": {("github", "org/repo")},
+        "2401.00002": {("zenodo", "42")},
+        "2401.00003": set(),
+    }
+    assert url_key("https://zenodo.org/api/records/42") == ("zenodo", "42")
+
+    found = {
+        "2401.00001": {("github", "org/repo"), ("github", "org/other")},
+        "2401.00002": set(),
+        "2401.00003": set(),
+    }
+    counts = score(expected, found)
+    assert counts["github"] == {"tp": 1, "fp": 1, "fn": 0, "precision": 0.5, "recall": 1.0}
+    assert counts["zenodo"]["recall"] == 0.0
+    assert counts["zenodo"]["precision"] is None
+
+
+def record_zenodo(adapter, request, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"description": "see https://arxiv.org/abs/2401.00001"}'
+    return response
+
+
+# None: the default of the CLI, a pool of processes to merge
+@pytest.mark.parametrize("workers", [1, None])
+def test_evaluate_latex_replayed(tmp_path, monkeypatch, workers):
+    fixtures = tmp_path / "fixtures"
+    paper = fixtures / "sources" / "2401.00001v1"
+    os.makedirs(paper)
+    (paper / "main.tex").write_text(
+        "\\documentclass{article}\n\\begin{document}\n"
+        "Our data is available at https://zenodo.org/records/42\n\\end{document}\n"
+    )
+    with monkeypatch.context() as patch:
+        patch.setattr(HTTPAdapter, "send", record_zenodo)
+        with ReplayArchive(fixtures / "responses.jsonl.gz", record=True):
+            requests.get("https://zenodo.org/api/records/42")
+    gold = tmp_path / "gold.csv"
+    gold.write_text("2401.00001v1.pdf,https://doi.org/10.5281/zenodo.42\n")
+    reference = tmp_path / "reference.csv"
+    reference.write_text(
+        REFERENCE_HEADER
+        + "2401.00001,Missing,,,Found,https://zenodo.org/api/records/42,Found\n"
+    )
+
+    report = Evaluator(fixtures, gold, reference, workers=workers).run(["latex"])
+
+    latex = report["latex"]
+    assert latex["papers"] == 1
+    assert latex["api_calls_per_paper"] == 1
+    assert latex["links_gold"]["zenodo"]["recall"] == 1.0
+    assert latex["bidirectional_reference"]["zenodo"]["precision"] == 1.0
+    # the fixtures are left untouched
+    assert not (paper / "merged.tex").exists()
+
+
+def test_evaluate_without_fixtures(tmp_path):
+    gold = tmp_path / "gold.csv"
+    gold.write_text("2401.00001v1.pdf,https://doi.org/10.5281/zenodo.42\n")
+    reference = tmp_path / "reference.csv"
+    reference.write_text(REFERENCE_HEADER)
+    evaluator = Evaluator(tmp_path / "fixtures", gold, reference)
+
+    with pytest.raises(EvaluationFixturesNotFound, match="any paper"):
+        evaluator.run(["latex", "pdf"])
+
+    os.makedirs(tmp_path / "fixtures" / "sources" / "2401.00001v1")
+    with pytest.raises(EvaluationFixturesNotFound, match="recorded responses"):
+        evaluator.run(["latex"])
@@ -0,0 +1,70 @@
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import src.github
+from src.github import GitHubAPI
+
+RATE_LIMIT_HEADERS = {
+    "X-RateLimit-Limit": "5000",
+    "X-RateLimit-Remaining": "4000",
+    "X-RateLimit-Reset": "2000000000",
+}
+
+
+class Clock:
+    """Fake time of the token pool, its sleeps advance it."""
+
+    def __init__(self):
+        self.now = 1_000_000
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def github_send(sent):
+    def send(adapter, request, **kwargs):
+        sent.append(request.url)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.headers.update(RATE_LIMIT_HEADERS)
+        if len(sent) == 1:
+            response.status_code = 403
+            response.headers["Retry-After"] = "30"
+            content = {"message": "You have exceeded a secondary rate limit."}
+        elif request.url.endswith("/contents/"):
+            response.status_code = 200
+            content = []
+        else:
+            response.status_code = 200
+            content = {"description": "A repo", "full_name": "org/repo"}
+        response._content = json.dumps(content).encode("utf-8")
+        return response
+
+    return send
+
+
+def test_secondary_rate_limit_backs_off(monkeypatch):
+    sent = []
+    clock = Clock()
+    monkeypatch.setattr(HTTPAdapter, "send", github_send(sent))
+    monkeypatch.setattr(src.github, "time", clock)
+
+    github = GitHubAPI("token")
+    description, readme, url = github.get_description_readme("org", "repo")
+
+    assert description == "A repo"
+    assert readme == ""
+    # retried once after the advised wait, not at once
+    assert len(sent) == 3
+    assert sum(clock.sleeps) >= 30
+    # the quota is read from the last successful response
+    assert github._tokens.clients[0].remaining["rest"] == 4000
+    github.close()
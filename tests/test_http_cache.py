@@ -0,0 +1,69 @@
+import os
+
+from src.http_cache import HTTPCache
+from src.metrics import metrics
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, allow_redirects=True):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+def test_get_cached_and_revalidated(tmp_path):
+    cache = HTTPCache(folder=tmp_path, ttl=60)
+    session = FakeSession(
+        [FakeResponse(200, b"record", {"ETag": '"v1"'}), FakeResponse(304)]
+    )
+    metrics.reset()
+
+    assert cache.get("https://zenodo.org/api/records/1", session, api="zenodo").text == "record"
+    assert cache.get("https://zenodo.org/api/records/1", session, api="zenodo").text == "record"
+    assert len(session.requests) == 1
+    assert cache.hits == 1
+
+    # expired: revalidated with the ETag
+    expired = HTTPCache(folder=tmp_path, ttl=0)
+    response = expired.get("https://zenodo.org/api/records/1", session, api="zenodo")
+    assert response.text == "record"
+    assert session.requests[-1]["If-None-Match"] == '"v1"'
+    assert expired.revalidated == 1
+    # the cache hit is not an API call
+    [counter] = [c for c in metrics.snapshot()["counters"] if c["name"] == "api_calls_total"]
+    assert counter["value"] == 2
+
+
+def test_transient_errors_not_cached(tmp_path):
+    cache = HTTPCache(folder=tmp_path)
+    session = FakeSession([FakeResponse(503), FakeResponse(200, b"ok")])
+
+    assert cache.get("https://zenodo.org/api/records/1", session).status_code == 503
+    assert cache.get("https://zenodo.org/api/records/1", session).text == "ok"
+
+
+def test_values_and_eviction(tmp_path):
+    cache = HTTPCache(folder=tmp_path, max_size=1000)
+    cache.set_value("github:test/myrepo", ["description", "readme", "url"])
+    assert cache.get_value("github:test/myrepo") == ["description", "readme", "url"]
+    assert cache.get_value("github:test/other") is None
+
+    for i in range(20):
+        cache.set_value(f"github:test/repo{i}", "x" * 100)
+    size = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert size <= 1000
+    assert cache.get_value("github:test/repo19") == "x" * 100
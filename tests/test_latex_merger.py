@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from src.latex.latex_merger import LatexMerger
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        fp.write(content)
+
+
+def test_run(tmp_path):
+    folder_path = tmp_path / "sources" / "1234.0001v1"
+    _write(
+        folder_path / "main.tex",
+        "\\documentclass{article}\n"
+        "\\begin{document}\n"
+        "\\input{sections/intro}\n"
+        "% \\input{old}\n"
+        "Code in \\cite{code}. \\include{sections/intro}\n"
+        "Both in \\cite{other,\n  code}.\n"
+        "\\end{document}\n",
+    )
+    _write(folder_path / "sections" / "intro.tex", "Introduction text.\n")
+    _write(folder_path / "old.tex", "Old text.\n")
+    _write(folder_path / "figures" / "plot.tex", "\\documentclass{standalone}\n")
+    _write(
+        folder_path / "main.bbl",
+        "\\bibitem{code} Code. \\url{https://github.com/org/repo}\n"
+        "\\bibitem{other} Other.\n",
+    )
+
+    LatexMerger(tmp_path / "sources", workers=1).run()
+
+    with open(folder_path / "merged.tex") as fp:
+        merged = fp.read()
+    assert merged.count("Introduction text.") == 1
+    assert merged.index("\\begin{document}") < merged.index("Introduction text.")
+    # the files not used, appended after the main document
+    assert merged.index("\\end{document}") < merged.index("Old text.")
+    assert merged.index("\\end{document}") < merged.index("standalone")
+    assert "Code in https://github.com/org/repo." in merged
+    # a citation spanning lines
+    assert "Both in https://github.com/org/repo \\cite{other}." in merged
+
+
+@pytest.mark.parametrize(
+    "inclusion, filepath",
+    [
+        ("\\input sections/intro", "sections/intro.tex"),
+        ("\\input{sections/intro.tex}", "sections/intro.tex"),
+        ("\\include{sections/intro}", "sections/intro.tex"),
+        ("\\subfile{sections/intro}", "sections/intro.tex"),
+        ("\\import{sections/}{intro}", "sections/intro.tex"),
+        ("\\subimport{sections/}{intro}", "sections/intro.tex"),
+        ("\\subimport*{sections/}{intro.tex}", "sections/intro.tex"),
+        ("\\inputfrom{sections}{intro}", "sections/intro.tex"),
+        ("\\includeonly{sections/intro}\n\\include{sections/intro}", "sections/intro.tex"),
+        # not followed, appended after the main document
+        ("\\includegraphics{sections/intro}", "sections/intro.tex"),
+    ],
+)
+def test_run_inclusions(tmp_path, inclusion, filepath):
+    folder_path = tmp_path / "sources" / "1234.0001v1"
+    _write(
+        folder_path / "main.tex",
+        f"\\documentclass{{article}}\n\\begin{{document}}\n{inclusion}\n\\end{{document}}\n",
+    )
+    _write(folder_path / filepath, "Code at https://github.com/org/repo\n")
+
+    LatexMerger(tmp_path / "sources", workers=1).run()
+
+    with open(folder_path / "merged.tex") as fp:
+        merged = fp.read()
+    assert merged.count("https://github.com/org/repo") == 1
+    if "graphics" not in inclusion:
+        assert merged.index("https://github.com/org/repo") < merged.index("\\end{document}")
+
+
+def test_subimport_relative_to_the_file(tmp_path):
+    folder_path = tmp_path / "sources" / "1234.0001v1"
+    _write(
+        folder_path / "main.tex",
+        "\\documentclass{article}\n\\begin{document}\n\\input{chapters/one}\n\\end{document}\n",
+    )
+    _write(folder_path / "chapters" / "one.tex", "One.\n\\subimport{parts/}{two}\n")
+    _write(folder_path / "chapters" / "parts" / "two.tex", "Two.\n")
+
+    LatexMerger(tmp_path / "sources", workers=1).run()
+
+    with open(folder_path / "merged.tex") as fp:
+        assert fp.read().split()[2:5] == ["One.", "Two.", "\\end{document}"]
+
+
+def test_run_without_main(tmp_path):
+    folder_path = tmp_path / "sources" / "1234.0001v1"
+    _write(folder_path / "a.tex", "First.\n")
+    _write(folder_path / "b.tex", "Second.\n")
+    (tmp_path / "sources" / "1234.0002v1").mkdir()
+    # interrupted merge
+    _write(tmp_path / "sources" / "1234.0002v1" / "merged.tex.part", "trunc")
+
+    LatexMerger(tmp_path / "sources", workers=2).run()
+
+    with open(folder_path / "merged.tex") as fp:
+        assert fp.read().split() == ["First.", "Second."]
+    assert not os.path.exists(tmp_path / "sources" / "1234.0002v1" / "merged.tex")
+    assert not os.path.exists(folder_path / "merged.tex.part")
@@ -0,0 +1,28 @@
+import gzip
+import logging
+from logging.handlers import RotatingFileHandler
+
+from src.logger import _gzip_namer, _gzip_rotator
+
+
+def test_rotated_logs_gzipped(tmp_path):
+    handler = RotatingFileHandler(tmp_path / "log.log", maxBytes=200, backupCount=2)
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    logger = logging.getLogger("test rotation")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(100):
+            logger.warning("line %d", i)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "log.log",
+        "log.log.1.gz",
+        "log.log.2.gz",
+    ]
+    with gzip.open(tmp_path / "log.log.1.gz", "rt") as fp:
+        assert fp.read().startswith("line")
@@ -0,0 +1,43 @@
+import json
+
+from src.metrics import Metrics, metrics
+from src.scanner import scan_files
+
+
+def test_counters_histograms_and_dumps(tmp_path):
+    registry = Metrics()
+    registry.inc("api_calls_total", api="zenodo")
+    registry.inc("api_calls_total", 2, api="zenodo")
+    registry.observe("tika_seconds", 0.2, server="http://tika")
+    registry.observe("tika_seconds", 7, server="http://tika")
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"] == [
+        {"name": "api_calls_total", "labels": {"api": "zenodo"}, "value": 3}
+    ]
+    histogram = snapshot["histograms"][0]
+    assert histogram["count"] == 2
+    assert histogram["p50"] == 0.5
+    assert histogram["max"] == 7
+
+    prometheus = registry.to_prometheus()
+    assert 'bidir_api_calls_total{api="zenodo"} 3' in prometheus
+    assert 'bidir_tika_seconds_bucket{server="http://tika",le="0.5"} 1' in prometheus
+    assert 'bidir_tika_seconds_bucket{server="http://tika",le="+Inf"} 2' in prometheus
+    assert 'bidir_tika_seconds_count{server="http://tika"} 2' in prometheus
+
+    registry.dump(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"][0]["value"] == 3
+    assert len(registry.summary()) == 2
+
+
+def test_scan_time_recorded(tmp_path):
+    filepath = tmp_path / "extracted.txt"
+    filepath.write_text("code at https://github.com/org/repo")
+    metrics.reset()
+
+    list(scan_files([("2401.00001", str(filepath))], workers=1))
+
+    [histogram] = metrics.snapshot()["histograms"]
+    assert histogram["name"] == "scan_seconds"
+    assert histogram["count"] == 1
@@ -0,0 +1,118 @@
+import json
+import os
+
+import requests
+import tika.tika
+
+from src.pdf import pdf_backends
+from src.pdf.pdf_backends import PyPDFBackend, TikaBackend
+from src.pdf.pdf_extractor import PDFExtractor
+
+
+def test_run(tmp_path, monkeypatch):
+    for dir in ["1234.0001v1", "1234.0002v1", "1234.0003v1", "1234.0004v1"]:
+        os.makedirs(tmp_path / "pdfs" / dir)
+        (tmp_path / "pdfs" / dir / f"{dir}.pdf").write_bytes(b"%PDF")
+    (tmp_path / "pdfs" / "1234.0003v1" / "appendix.pdf").write_bytes(b"%PDF")
+
+    calls = []
+
+    def from_file(filename, server_url, requestOptions):
+        calls.append((os.path.basename(filename), server_url))
+        if "0002" in filename and len([c for c in calls if "0002" in c[0]]) == 1:
+            raise requests.exceptions.ConnectionError("transient")
+        if "0003v1.pdf" in filename:
+            return {"status": 422, "content": None}
+        if "0004" in filename:
+            raise RuntimeError("Unable to start Tika server")
+        return {"status": 200, "content": f"content of {filename}"}
+
+    monkeypatch.setattr(pdf_backends.parser, "from_file", from_file)
+    monkeypatch.setattr(TikaBackend, "RETRY_SLEEP_TIME", 0)
+    failures_filepath = tmp_path / "failures.jsonl"
+    backend = TikaBackend(
+        ["http://localhost:9998", "http://localhost:9999"], concurrency=1, retries=3
+    )
+    extractor = PDFExtractor(
+        backend, input_folder=tmp_path / "pdfs", failures_filepath=failures_filepath
+    )
+    extractor.run()
+
+    assert tika.tika.TikaClientOnly
+    assert os.path.exists(tmp_path / "pdfs" / "1234.0001v1" / "extracted.txt")
+    # retried
+    assert os.path.exists(tmp_path / "pdfs" / "1234.0002v1" / "extracted.txt")
+    # not retried, logged and skipped, the other PDFs written
+    with open(tmp_path / "pdfs" / "1234.0003v1" / "extracted.txt") as fp:
+        assert "appendix.pdf" in fp.read()
+    # failed because of the server, not written to be retried
+    assert not os.path.exists(tmp_path / "pdfs" / "1234.0004v1" / "extracted.txt")
+    assert len([call for call in calls if call[0] == "1234.0003v1.pdf"]) == 1
+    with open(failures_filepath) as fp:
+        failures = [json.loads(line) for line in fp]
+    # unexpected errors fail the paper only
+    assert sorted(failure["dir"] for failure in failures) == ["1234.0003v1", "1234.0004v1"]
+    assert not any(name.endswith(".part") for _, _, names in os.walk(tmp_path) for name in names)
+
+
+def test_pypdf_links_only(tmp_path):
+    from pypdf import PdfWriter
+    from pypdf.annotations import Link
+
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    writer.add_annotation(0, Link(rect=(10, 10, 100, 20), url="https://github.com/org/repo"))
+    os.makedirs(tmp_path / "pdfs" / "1234.0001v1")
+    with open(tmp_path / "pdfs" / "1234.0001v1" / "1234.0001v1.pdf", "wb") as fp:
+        writer.write(fp)
+    (tmp_path / "pdfs" / "1234.0002v1").mkdir()
+    (tmp_path / "pdfs" / "1234.0002v1" / "1234.0002v1.pdf").write_bytes(b"not a PDF")
+
+    extractor = PDFExtractor(
+        PyPDFBackend(links_only=True, workers=2),
+        input_folder=tmp_path / "pdfs",
+        failures_filepath=tmp_path / "failures.jsonl",
+    )
+    extractor.run()
+
+    with open(tmp_path / "pdfs" / "1234.0001v1" / "extracted.txt") as fp:
+        assert fp.read() == "https://github.com/org/repo\n"
+    # malformed, logged and not retried by the next runs
+    with open(tmp_path / "pdfs" / "1234.0002v1" / "extracted.txt") as fp:
+        assert fp.read() == ""
+    with open(tmp_path / "failures.jsonl") as fp:
+        assert [json.loads(line)["dir"] for line in fp] == ["1234.0002v1"]
+
+
+class FakePage(dict):
+    def __init__(self, text, extracted):
+        super().__init__()
+        self.text = text
+        self.extracted = extracted
+
+    def extract_text(self):
+        self.extracted.append(self.text)
+        return self.text
+
+
+class FakeReader:
+    def __init__(self, texts):
+        self.extracted = []
+        self.pages = [FakePage(text, self.extracted) for text in texts]
+        self.outline = []
+
+
+def test_pypdf_targeted():
+    backend = PyPDFBackend(targeted=True)
+    texts = [f"page {i}" for i in range(10)]
+    texts[8] = "[1] code at https://github.com/org/repo"
+    reader = FakeReader(texts)
+
+    assert "github.com/org/repo" in backend._extract_targeted(reader, "1234.pdf")
+    # first and last pages only
+    assert reader.extracted == ["page 0", "page 1", "page 7", texts[8], "page 9"]
+
+    reader = FakeReader([f"page {i}" for i in range(10)])
+    text = backend._extract_targeted(reader, "1234.pdf")
+    assert text == "\n".join(f"page {i}" for i in range(10))
+    assert len(reader.extracted) == 10
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from src.pipeline import Pipeline
+
+
+def test_pipeline_overlaps_stages():
+    started = {}
+    lock = threading.Lock()
+
+    def stage(name, func):
+        def run(item):
+            with lock:
+                started.setdefault(name, time.monotonic())
+            time.sleep(0.02)
+            return func(item)
+
+        return run
+
+    pipeline = (
+        Pipeline(queue_size=2)
+        .add_stage("download", stage("download", lambda item: item), workers=2)
+        # dropped
+        .add_stage("extract", stage("extract", lambda item: None if item == 3 else item))
+        # failed, logged and skipped
+        .add_stage("scan", lambda item: 10 // (item - 5))
+    )
+    start = time.monotonic()
+    outputs = list(pipeline.run(range(10)))
+
+    assert sorted(outputs) == sorted(10 // (item - 5) for item in [0, 1, 2, 4, 6, 7, 8, 9])
+    # the next stage started before the previous one had done all the items
+    assert started["extract"] - start < 0.1
+
+
+def test_pipeline_stops_when_items_fail():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("arXiv search failed")
+
+    pipeline = Pipeline().add_stage("double", lambda item: item * 2, workers=2)
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(pipeline.run(items())), daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert sorted(result) == [2, 4]
@@ -0,0 +1,120 @@
+import contextlib
+import threading
+import time
+
+import requests
+
+from src.enums import Repos
+from src.http_cache import HTTPCache
+from src.pub_finder import PubFinder
+from src.zenodo import ZenodoAPI
+
+
+class StubGitHub:
+    def __init__(self, readmes, delay=0):
+        self.readmes = readmes
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_description_readme(self, org, repo, throttle=contextlib.nullcontext):
+        with self._lock:
+            self.calls.append((org, repo))
+        time.sleep(self.delay)
+        return "", self.readmes.get((org, repo), ""), f"https://github.com/{org}/{repo}"
+
+    def get_descriptions_readmes(self, repos, throttle=contextlib.nullcontext):
+        return {_id: self.get_description_readme(*_id) for _id in repos}
+
+
+class StubZenodo:
+    def __init__(self, records):
+        self.records = records
+
+    def get_record(self, recid_or_doi, throttle=contextlib.nullcontext):
+        return self.records.get(recid_or_doi, ""), recid_or_doi
+
+
+def test_find():
+    github = StubGitHub({("test", "myrepo"): "see https://arxiv.org/abs/1234.5678"})
+    zenodo = StubZenodo({"123": "https://arxiv.org/pdf/1234.5678"})
+    finder = PubFinder(github, zenodo)
+
+    results = finder.find(
+        "1234.5678",
+        {
+            Repos.GITHUB.value: [("test", "myrepo"), ("test", "other")],
+            Repos.ZENODO_RECORD.value: ["123"],
+            Repos.ZENODO_DOI.value: [],
+        },
+    )
+    assert results == {
+        Repos.GITHUB.value: {("test", "myrepo"): "Found", ("test", "other"): "Not found"},
+        Repos.ZENODO_RECORD.value: {"123": "Found"},
+        Repos.ZENODO_DOI.value: {},
+    }
+    finder.close()
+
+
+def test_find_many_concurrent():
+    github = StubGitHub({}, delay=0.2)
+    finder = PubFinder(github, StubZenodo({}))
+    publications = [
+        (f"0000.000{i}", {Repos.GITHUB.value: [("test", f"repo{i}")]}) for i in range(4)
+    ]
+
+    start = time.monotonic()
+    results = list(finder.find_many(publications))
+    elapsed = time.monotonic() - start
+
+    assert [publication_id for publication_id, _ in results] == [
+        publication_id for publication_id, _ in publications
+    ]
+    assert len(github.calls) == 4
+    # 4 concurrent github requests, well below 4 * 0.2s sequential time
+    assert elapsed < 0.6
+    finder.close()
+
+
+def test_find_many_fetches_repos_once():
+    github = StubGitHub({("test", "shared"): "https://arxiv.org/abs/0000.0001"}, delay=0.05)
+    finder = PubFinder(github, StubZenodo({}))
+    publications = [
+        (f"0000.000{i}", {Repos.GITHUB.value: [("test", "shared"), ("Test", "Shared.git")]})
+        for i in range(6)
+    ]
+
+    results = dict(finder.find_many(publications))
+
+    assert github.calls == [("test", "shared")]
+    assert results["0000.0001"][Repos.GITHUB.value] == {
+        ("test", "shared"): "Found",
+        ("Test", "Shared.git"): "Found",
+    }
+    assert results["0000.0002"][Repos.GITHUB.value][("test", "shared")] == "Not found"
+    finder.close()
+
+
+class FakeSession:
+    def get(self, url, headers=None, allow_redirects=True):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"see https://arxiv.org/abs/0000.0001"
+        return response
+
+
+def test_cache_hits_not_rate_limited(tmp_path):
+    cache = HTTPCache(folder=tmp_path)
+    recids = [str(recid) for recid in range(10)]
+    for recid in recids:
+        cache.get(f"https://zenodo.org/api/records/{recid}", FakeSession())
+    finder = PubFinder(StubGitHub({}), ZenodoAPI(cache))
+
+    start = time.monotonic()
+    results = finder.find("0000.0001", {Repos.ZENODO_RECORD.value: recids})
+    elapsed = time.monotonic() - start
+
+    assert set(results[Repos.ZENODO_RECORD.value].values()) == {"Found"}
+    # 10 requests to Zenodo would take 4s at 2 per second
+    assert elapsed < 1
+    finder.close()
@@ -0,0 +1,72 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.replay import ReplayArchive
+
+
+def fake_send(adapter, request, **kwargs):
+    response = requests.Response()
+    response.url = request.url
+    response.request = request
+    response.headers["Authorization"] = "secret"
+    if request.url.endswith("/graphql"):
+        response.status_code = 200
+        response._content = (
+            b'{"data": {"r0": {"description": "first"}, "r1": {"description": "second"}}}'
+        )
+    else:
+        response.status_code = 200
+        response._content = b'{"metadata": {"description": "record"}}'
+    return response
+
+
+def graphql(session, repos):
+    variables = {}
+    for i, (org, name) in enumerate(repos):
+        variables[f"o{i}"] = org
+        variables[f"n{i}"] = name
+    response = session.post(
+        "https://api.github.com/graphql", json={"query": "...", "variables": variables}
+    )
+    return response.json()["data"]
+
+
+def test_record_and_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(HTTPAdapter, "send", fake_send)
+    filepath = tmp_path / "responses.jsonl.gz"
+
+    with ReplayArchive(filepath, record=True) as archive:
+        session = requests.Session()
+        assert session.get("https://zenodo.org/api/records/1").status_code == 200
+        graphql(session, [("org", "first"), ("org", "second")])
+    assert archive.requests == 2
+
+    monkeypatch.setattr(HTTPAdapter, "send", None)  # no network when replaying
+    with ReplayArchive(filepath) as archive:
+        session = requests.Session()
+        response = session.get("https://zenodo.org/api/records/1")
+        assert response.json() == {"metadata": {"description": "record"}}
+        assert "Authorization" not in response.headers
+        assert session.get("https://zenodo.org/api/records/2").status_code == 404
+        # batched differently than when recorded
+        assert graphql(session, [("org", "second"), ("org", "other")]) == {
+            "r0": {"description": "second"},
+            "r1": None,
+        }
+    assert archive.requests == 3
+    assert archive.missed == 2
+
+
+def test_replay_rate_limits(tmp_path, monkeypatch):
+    monkeypatch.setattr(HTTPAdapter, "send", fake_send)
+    filepath = tmp_path / "responses.jsonl.gz"
+    with ReplayArchive(filepath, record=True):
+        requests.get("https://zenodo.org/api/records/1")
+
+    with ReplayArchive(filepath, rate_limits={"zenodo.org": (2, 60)}) as archive:
+        statuses = [requests.get("https://zenodo.org/api/records/1").status_code for _ in range(3)]
+        response = requests.get("https://zenodo.org/api/records/1")
+    assert statuses == [200, 200, 429]
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+    assert int(response.headers["Retry-After"]) > 0
+    assert archive.limited == 2
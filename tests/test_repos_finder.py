@@ -148,3 +148,32 @@ def test_find_contextualized():
     assert not results[Repos.GITHUB.value]
     assert not results[Repos.ZENODO_RECORD.value]
     assert not results[Repos.ZENODO_DOI.value]
+
+
+def test_find_all_glued_urls():
+    finder = ReposFinder()
+    # URLs glued together, as often extracted from PDFs, or in uppercase
+    text = "see https://github.com/test/myrepohttps://zenodo.org/records/123456 and HTTPS://GITHUB.COM/Test/Other."
+    results = finder.find("1234", text)
+    assert results[Repos.GITHUB.value] == [
+        ("test", "myrepohttps"),
+        ("Test", "Other."),
+        ("Test", "Other"),
+    ]
+    assert results[Repos.ZENODO_RECORD.value] == ["123456"]
+
+
+def test_find_contextualized_consecutive_urls():
+    finder = ReposFinder(contextualized_words=3)
+    # both URLs are close to the keyword
+    text = "Lorem ipsum https://github.com/test/myrepo https://github.com/test/myrepo2 code et dolore"
+    results = finder.find("1234", text, contextualized=True)
+    assert results[Repos.GITHUB.value] == [("test", "myrepo"), ("test", "myrepo2")]
+
+    # URL inside a Latex command, the command counts as a word
+    text = "code a b \\url{https://github.com/test/myrepo}"
+    results = finder.find("1234", text, contextualized=True)
+    assert results[Repos.GITHUB.value] == [("test", "myrepo")]
+    text = "code a b c \\url{https://github.com/test/myrepo}"
+    results = finder.find("1234", text, contextualized=True)
+    assert not results[Repos.GITHUB.value]
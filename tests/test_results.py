@@ -0,0 +1,37 @@
+import csv
+
+from src.enums import Repos
+from src.results import ResultsWriter
+
+
+def test_write_and_resume(tmp_path):
+    filepath = tmp_path / "results.csv"
+    results = ResultsWriter(filepath)
+    results.write(
+        "1234.0001",
+        {
+            Repos.GITHUB.value: {("test", "a"): "Found", ("test", "b"): "Found"},
+            Repos.ZENODO_RECORD.value: {"123": "Not found"},
+        },
+    )
+    results.write("1234.0002", {Repos.GITHUB.value: {("test", "c"): "Not found"}})
+    results.close()
+
+    # interrupted while writing a publication
+    with open(filepath, "a") as fp:
+        fp.write("1234.0003,Fou")
+
+    results = ResultsWriter(filepath)
+    assert results.done == {"1234.0001", "1234.0002"}
+    results.write("1234.0003", {})
+    results.close()
+
+    with open(filepath, newline="") as fp:
+        rows = list(csv.reader(fp))
+    assert rows == [
+        ["ArXiV id", "Result", "Where"],
+        ["1234.0001", "Found", "Repo: github - ('test', 'a')"],
+        ["1234.0001", "Found", "Repo: github - ('test', 'b')"],
+        ["1234.0002", "Not found", ""],
+        ["1234.0003", "Not found", ""],
+    ]
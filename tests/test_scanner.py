@@ -0,0 +1,20 @@
+from src.scanner import scan_files
+
+
+def test_scan_files(tmp_path):
+    files = []
+    for i in range(6):
+        filepath = tmp_path / f"{i}.txt"
+        filepath.write_text(f"code at https://github.com/org/repo{i} and more text")
+        files.append((f"1234.000{i}", str(filepath)))
+
+    expected = {
+        f"1234.000{i}": {
+            "github": [("org", f"repo{i}")],
+            "zenodo-record": [],
+            "zenodo-doi": [],
+        }
+        for i in range(6)
+    }
+    assert dict(scan_files(files, workers=1)) == expected
+    assert dict(scan_files(files, workers=2)) == expected